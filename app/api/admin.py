@@ -1,21 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request, Response
+from fastapi.responses import RedirectResponse
+from sqlalchemy import select, update, func, case, and_, true
 from sqlalchemy.orm import Session
 from typing import Optional
-from pathlib import Path
 from app.database import get_db
 from app.models.template import Template
 from app.models.user import User, AuthProvider
 from app.schemas.template import TemplateCreate, TemplateUpdate, TemplateResponse
 from app.schemas.auth import LoginRequest, TokenResponse
 from app.utils.dependencies import get_current_admin
+from app.utils.http_cache import etag_matches
 from app.services.storage_service import StorageService
 from app.services.auth_service import AuthService
+from app.services.cache_service import cache_service, template_cache_key
+from app.services.template_service import TemplateService
 from app.config import settings
 from datetime import datetime
 import uuid
+import hashlib
+import logging
 
 router = APIRouter(prefix="/api/admin", tags=["Admin"])
+logger = logging.getLogger(__name__)
+
+# Columns returned by the admin template listings - selected directly so the
+# list endpoints skip ORM entity construction
+ADMIN_TEMPLATE_COLUMNS = (
+    Template.id,
+    Template.name,
+    Template.description,
+    Template.prompt,
+    Template.preview_image,
+    Template.is_free,
+    Template.is_active,
+    Template.price,
+    Template.currency,
+    Template.is_archived,
+    Template.archived_at,
+    Template.display_order,
+    Template.usage_count,
+    Template.created_at,
+    Template.updated_at,
+)
+
+# Dashboard counters are cached briefly; template mutations invalidate them
+ADMIN_STATS_CACHE_KEY = cache_service.make_key("admin", "stats")
+ADMIN_STATS_CACHE_TTL = 30  # seconds
+
+# The dashboard page is served by the StaticFiles mount in app.main
+ADMIN_DASHBOARD_URL = "/api/admin/static/admin_dashboard.html"
+
+def _template_exists(db: Session, template_id: int) -> bool:
+    """Cheap existence probe used to tell 404 apart from a state conflict"""
+    return db.execute(
+        select(Template.id).where(Template.id == template_id)
+    ).first() is not None
+
+def _template_list_etag(db: Session, filters: list, *variant) -> str:
+    """
+    Build an ETag for a template listing from MAX(updated_at) and COUNT(*)
+    over the same filters (the count catches permanent deletes)
+    """
+    max_updated, total = db.execute(
+        select(func.max(Template.updated_at), func.count(Template.id)).where(*filters)
+    ).one()
+    digest = hashlib.md5(f"{max_updated}:{total}:{variant}".encode()).hexdigest()
+    return f'"{digest}"'
+
+def _admin_template_rows(rows) -> list:
+    """Convert template rows to response dicts with full preview URLs"""
+    return [
+        {
+            **row._asdict(),
+            "preview_url": StorageService.get_file_url(row.preview_image) if row.preview_image else None,
+        }
+        for row in rows
+    ]
 
 # ============= ADMIN LOGIN =============
 @router.post("/login", response_model=TokenResponse)
@@ -65,7 +125,7 @@ async def create_template(
 ):
     """Create a new template with optional preview image (Admin only)"""
     
-    print(f"Creating template: name={name}, description={description}, prompt={prompt}")
+    logger.debug("Creating template name=%s", name)
     
     # Check if template name already exists
     existing = db.query(Template).filter(Template.name == name).first()
@@ -84,9 +144,9 @@ async def create_template(
                 preview_image, 
                 settings.TEMPLATE_PREVIEW_DIR
             )
-            print(f"Saved preview image: {preview_image_path}")
+            logger.debug("Saved preview image: %s", preview_image_path)
         except Exception as e:
-            print(f"Error saving preview image: {e}")
+            logger.error("Error saving preview image: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Failed to save preview image: {str(e)}"
@@ -108,12 +168,14 @@ async def create_template(
         db.add(template)
         db.commit()
         db.refresh(template)
+        await cache_service.delete(ADMIN_STATS_CACHE_KEY)
+        await TemplateService.invalidate_lists()
         
-        print(f"Template created successfully: {template.id}")
+        logger.info("Template created successfully: %s", template.id)
         return template
     except Exception as e:
         db.rollback()
-        print(f"Error creating template: {e}")
+        logger.error("Error creating template: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create template: {str(e)}"
@@ -169,7 +231,7 @@ async def update_template(
             try:
                 StorageService.delete_file(template.preview_image)
             except Exception as e:
-                print(f"Error deleting old preview: {e}")
+                logger.warning("Error deleting old preview: %s", e)
         
         # Upload new preview
         try:
@@ -188,6 +250,8 @@ async def update_template(
     try:
         db.commit()
         db.refresh(template)
+        await cache_service.delete(ADMIN_STATS_CACHE_KEY, template_cache_key(template_id))
+        await TemplateService.invalidate_lists()
         return template
     except Exception as e:
         db.rollback()
@@ -204,31 +268,41 @@ async def delete_template(
 ):
     """Archive a template (Admin only) - Soft delete to archive"""
     
-    template = db.query(Template).filter(Template.id == template_id).first()
-    if not template:
+    archived_at = datetime.utcnow()
+    
+    # Archive the template (and deactivate it) without loading the row
+    try:
+        result = db.execute(
+            update(Template)
+            .where(Template.id == template_id, Template.is_archived.is_(False))
+            .values(is_archived=True, archived_at=archived_at, is_active=False)
+        )
+    except Exception as e:
+        db.rollback()
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Template not found"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to archive template: {str(e)}"
         )
     
-    # Check if already archived
-    if template.is_archived:
+    if result.rowcount == 0:
+        if not _template_exists(db, template_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Template not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Template is already archived"
         )
     
-    # Archive the template
-    template.is_archived = True
-    template.archived_at = datetime.utcnow()
-    template.is_active = False  # Also deactivate
-    
     try:
         db.commit()
+        await cache_service.delete(ADMIN_STATS_CACHE_KEY, template_cache_key(template_id))
+        await TemplateService.invalidate_lists()
         return {
             "message": "Template archived successfully",
             "template_id": template_id,
-            "archived_at": template.archived_at
+            "archived_at": archived_at
         }
     except Exception as e:
         db.rollback()
@@ -245,27 +319,36 @@ async def restore_template(
 ):
     """Restore an archived template (Admin only)"""
     
-    template = db.query(Template).filter(Template.id == template_id).first()
-    if not template:
+    # Restore (and reactivate) in one UPDATE ... RETURNING
+    try:
+        template = db.execute(
+            update(Template)
+            .where(Template.id == template_id, Template.is_archived.is_(True))
+            .values(is_archived=False, archived_at=None, is_active=True)
+            .returning(Template)
+        ).scalar_one_or_none()
+    except Exception as e:
+        db.rollback()
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Template not found"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to restore template: {str(e)}"
         )
     
-    if not template.is_archived:
+    if template is None:
+        if not _template_exists(db, template_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Template not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Template is not archived"
         )
     
-    # Restore the template
-    template.is_archived = False
-    template.archived_at = None
-    template.is_active = True  # Reactivate
-    
     try:
         db.commit()
-        db.refresh(template)
+        await cache_service.delete(ADMIN_STATS_CACHE_KEY, template_cache_key(template_id))
+        await TemplateService.invalidate_lists()
         return {
             "message": "Template restored successfully",
             "template": template
@@ -304,12 +387,14 @@ async def permanently_delete_template(
         try:
             StorageService.delete_file(template.preview_image)
         except Exception as e:
-            print(f"Error deleting preview image: {e}")
+            logger.warning("Error deleting preview image: %s", e)
     
     # Permanently delete from database
     try:
         db.delete(template)
         db.commit()
+        await cache_service.delete(ADMIN_STATS_CACHE_KEY, template_cache_key(template_id))
+        await TemplateService.invalidate_lists()
         return {
             "message": "Template permanently deleted",
             "template_id": template_id
@@ -323,6 +408,8 @@ async def permanently_delete_template(
 
 @router.get("/templates/all")
 async def get_all_templates_admin(
+    request: Request,
+    response: Response,
     include_inactive: bool = False,
     show_archived: bool = False,
     current_admin: User = Depends(get_current_admin),
@@ -330,41 +417,27 @@ async def get_all_templates_admin(
 ):
     """Get all templates (Admin only) - Excludes archived by default"""
     
-    query = db.query(Template)
+    filters = []
     
     # By default, exclude archived templates
     if not show_archived:
-        query = query.filter(Template.is_archived == False)
+        filters.append(Template.is_archived.is_(False))
     
     # Filter by active status
     if not include_inactive and not show_archived:
-        query = query.filter(Template.is_active == True)
-    
-    templates = query.order_by(Template.display_order).all()
-    
-    # Add full URL for preview images
-    templates_data = []
-    for template in templates:
-        template_dict = {
-            "id": template.id,
-            "name": template.name,
-            "description": template.description,
-            "prompt": template.prompt,
-            "preview_image": template.preview_image,
-            "preview_url": StorageService.get_file_url(template.preview_image) if template.preview_image else None,
-            "is_free": template.is_free,
-            "is_active": template.is_active,
-            "price":template.price,
-            "currency":template.currency,
-            "is_archived": template.is_archived,
-            "archived_at": template.archived_at,
-            "display_order": template.display_order,
-            "usage_count": template.usage_count,
-            "created_at": template.created_at,
-            "updated_at": template.updated_at
-        }
-        templates_data.append(template_dict)
+        filters.append(Template.is_active.is_(True))
     
+    etag = _template_list_etag(db, filters, include_inactive, show_archived)
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    rows = db.execute(
+        select(*ADMIN_TEMPLATE_COLUMNS).where(*filters).order_by(Template.display_order)
+    ).all()
+    templates_data = _admin_template_rows(rows)
+    
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
     return {
         "templates": templates_data,
         "total": len(templates_data)
@@ -372,38 +445,29 @@ async def get_all_templates_admin(
 
 @router.get("/templates/archived")
 async def get_archived_templates(
+    request: Request,
+    response: Response,
     current_admin: User = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
     """Get all archived templates (Admin only)"""
     
-    templates = db.query(Template).filter(
-        Template.is_archived == True
-    ).order_by(Template.archived_at.desc()).all()
-    
-    # Add full URL for preview images
-    templates_data = []
-    for template in templates:
-        template_dict = {
-            "id": template.id,
-            "name": template.name,
-            "description": template.description,
-            "prompt": template.prompt,
-            "preview_image": template.preview_image,
-            "preview_url": StorageService.get_file_url(template.preview_image) if template.preview_image else None,
-            "is_free": template.is_free,
-            "is_active": template.is_active,
-            "price":template.price,
-            "currency":template.currency,
-            "is_archived": template.is_archived,
-            "archived_at": template.archived_at,
-            "display_order": template.display_order,
-            "usage_count": template.usage_count,
-            "created_at": template.created_at,
-            "updated_at": template.updated_at
-        }
-        templates_data.append(template_dict)
+    filters = [Template.is_archived.is_(True)]
     
+    etag = _template_list_etag(db, filters, "archived")
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    stmt = (
+        select(*ADMIN_TEMPLATE_COLUMNS)
+        .where(*filters)
+        .order_by(Template.archived_at.desc())
+    )
+    rows = db.execute(stmt).all()
+    templates_data = _admin_template_rows(rows)
+    
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
     return {
         "templates": templates_data,
         "total": len(templates_data)
@@ -418,22 +482,38 @@ async def get_admin_stats(
     """Get admin dashboard statistics"""
     from app.models.generation import Generation
     
-    total_users = db.query(User).count()
-    total_generations = db.query(Generation).count()
-    total_templates = db.query(Template).filter(
-        Template.is_active == True,
-        Template.is_archived == False
-    ).count()
-    subscribed_users = db.query(User).filter(User.is_subscribed == True).count()
-    archived_templates = db.query(Template).filter(Template.is_archived == True).count()
-    
-    return {
-        "total_users": total_users,
-        "total_generations": total_generations,
-        "total_templates": total_templates,
-        "subscribed_users": subscribed_users,
-        "archived_templates": archived_templates
+    cached = await cache_service.get_json(ADMIN_STATS_CACHE_KEY)
+    if cached is not None:
+        return cached
+    
+    # One round trip: conditional aggregates per table, combined as scalar subqueries
+    user_counts = select(
+        func.count(User.id).label("total_users"),
+        func.count(case((User.is_subscribed.is_(True), 1))).label("subscribed_users")
+    ).subquery()
+    template_counts = select(
+        func.count(case((and_(Template.is_active.is_(True), Template.is_archived.is_(False)), 1))).label("total_templates"),
+        func.count(case((Template.is_archived.is_(True), 1))).label("archived_templates")
+    ).subquery()
+    generation_counts = select(
+        func.count(Generation.id).label("total_generations")
+    ).subquery()
+    
+    row = db.execute(
+        select(user_counts, template_counts, generation_counts).select_from(
+            user_counts.join(template_counts, true()).join(generation_counts, true())
+        )
+    ).one()
+    
+    stats = {
+        "total_users": row.total_users,
+        "total_generations": row.total_generations,
+        "total_templates": row.total_templates,
+        "subscribed_users": row.subscribed_users,
+        "archived_templates": row.archived_templates
     }
+    await cache_service.set_json(ADMIN_STATS_CACHE_KEY, stats, ttl=ADMIN_STATS_CACHE_TTL)
+    return stats
 
 # ============= USER MANAGEMENT =============
 @router.get("/users")
@@ -444,10 +524,25 @@ async def get_all_users(
     db: Session = Depends(get_db)
 ):
     """Get all users (Admin only)"""
-    users = db.query(User).offset(skip).limit(limit).all()
+    stmt = (
+        select(User, func.count().over().label("total"))
+        .order_by(User.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    rows = db.execute(stmt).all()
+    
+    if rows:
+        total = rows[0].total
+    elif skip:
+        # Plain COUNT, not Query.count()'s subquery
+        total = db.execute(select(func.count()).select_from(User)).scalar_one()
+    else:
+        total = 0
+    
     return {
-        "users": users,
-        "total": db.query(User).count()
+        "users": [row[0] for row in rows],
+        "total": total
     }
 
 @router.post("/users/{user_id}/grant-credits")
@@ -459,30 +554,30 @@ async def grant_credits(
 ):
     """Grant credits to a user (Admin only)"""
     
-    user = db.query(User).filter(User.id == user_id).first()
+    # Atomic increment - no read-modify-write on the user row
+    user = db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(free_credits_remaining=User.free_credits_remaining + credits)
+        .returning(User.id, User.email, User.free_credits_remaining)
+    ).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    user.credits_remaining += credits
     db.commit()
     
     return {
         "message": f"Granted {credits} credits to user",
         "user_id": user.id,
         "user_email": user.email,
-        "new_balance": user.credits_remaining
+        "new_balance": user.free_credits_remaining
     }
 
 # ============= ADMIN DASHBOARD PAGE =============
-@router.get("/dashboard", response_class=HTMLResponse)
+@router.get("/dashboard", response_class=RedirectResponse)
 async def admin_dashboard():
-    """Serve the admin dashboard HTML page"""
-    dashboard_path = Path(__file__).parent.parent / "templates" / "admin_dashboard.html"
-    
-    if not dashboard_path.exists():
-        raise HTTPException(status_code=404, detail="Admin dashboard not found")
-    
-    return FileResponse(dashboard_path)
\ No newline at end of file
+    """Redirect to the statically served admin dashboard HTML page"""
+    return RedirectResponse(url=ADMIN_DASHBOARD_URL)
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.schemas.auth import Token, LoginRequest, GoogleAuthRequest
@@ -61,23 +62,30 @@ async def get_user_credits(
     Get detailed credit and token information for current user
     """
     
-    # Count unused paid tokens
-    unused_tokens = db.query(PaymentToken).filter(
-        PaymentToken.user_id == current_user.id,
-        PaymentToken.status == TokenStatus.UNUSED,
-        PaymentToken.payment_status == PaymentStatus.COMPLETED
+    # Unused paid tokens grouped per template in SQL; the window sum gives the
+    # overall token count without a second query
+    rows = db.execute(
+        select(
+            PaymentToken.template_id,
+            func.json_agg(
+                func.json_build_object(
+                    "token_id", PaymentToken.id,
+                    "amount_paid", PaymentToken.amount_paid,
+                    "created_at", PaymentToken.created_at
+                )
+            ).label("tokens"),
+            func.sum(func.count()).over().label("total")
+        )
+        .where(
+            PaymentToken.user_id == current_user.id,
+            PaymentToken.status == TokenStatus.UNUSED,
+            PaymentToken.payment_status == PaymentStatus.COMPLETED
+        )
+        .group_by(PaymentToken.template_id)
     ).all()
     
-    # Group by template
-    tokens_by_template = {}
-    for token in unused_tokens:
-        if token.template_id not in tokens_by_template:
-            tokens_by_template[token.template_id] = []
-        tokens_by_template[token.template_id].append({
-            "token_id": token.id,
-            "amount_paid": float(token.amount_paid),
-            "created_at": token.created_at.isoformat()
-        })
+    tokens_by_template = {row.template_id: row.tokens for row in rows}
+    unused_paid_tokens = int(rows[0].total) if rows else 0
     
     return {
         "user_id": current_user.id,
@@ -85,7 +93,7 @@ async def get_user_credits(
         "free_credits_remaining": current_user.free_credits_remaining,
         "is_subscribed": current_user.is_subscribed,
         "can_generate_free": current_user.free_credits_remaining > 0,
-        "unused_paid_tokens": len(unused_tokens),
+        "unused_paid_tokens": unused_paid_tokens,
         "tokens_by_template": tokens_by_template,
         "message": f"You have {current_user.free_credits_remaining} free generations remaining"
     }
\ No newline at end of file
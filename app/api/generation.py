@@ -1,488 +1,826 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from fastapi.responses import HTMLResponse, FileResponse
-from sqlalchemy.orm import Session
-from typing import Optional
-from pathlib import Path
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks, Request, Response, Form
+from fastapi.responses import FileResponse, RedirectResponse, ORJSONResponse
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.orm import Session, raiseload
+from typing import Optional, List, Tuple
 from app.database import get_db
+from app.config import settings
+from app.models.generation import Generation, GenerationStatus, GenerationMode
 from app.models.template import Template
-from app.models.user import User, AuthProvider
-from app.schemas.template import TemplateCreate, TemplateUpdate, TemplateResponse
-from app.schemas.auth import LoginRequest, TokenResponse
-from app.utils.dependencies import get_current_admin
+from app.models.user import User
+from app.models.payment_token import PaymentToken, TokenStatus, PaymentStatus
+from app.schemas.generation import GenerationResponse, GenerationListResponse, build_generation_urls
+from app.utils.dependencies import get_current_user
+from app.utils.http_cache import etag_matches
 from app.services.storage_service import StorageService
-from app.services.auth_service import AuthService
-from app.config import settings
-from datetime import datetime
-import uuid
+from app.services.s3_service import s3_service
+from app.services.cache_service import cache_service
+from app.services.template_service import TemplateService
+from app.celery_tasks import process_generation_task, cleanup_generation_files_task
+import asyncio
+import logging
+import mimetypes
+import os
 
-router = APIRouter(prefix="/api/admin", tags=["Admin"])
+router = APIRouter(prefix="/api/generate", tags=["Image Generation"])
+logger = logging.getLogger(__name__)
 
-# ============= ADMIN LOGIN =============
-@router.post("/login", response_model=TokenResponse)
-async def admin_login(
-    login_data: LoginRequest,
-    db: Session = Depends(get_db)
-):
-    """Admin login endpoint - only for users with is_admin=True"""
-    
-    # Authenticate user
-    user = AuthService.authenticate_user(db, login_data.email, login_data.password)
-    
-    # Check if user is admin
-    if not user.is_admin:
+# Status polling cache (seconds)
+GENERATION_STATUS_POLL_TTL = 2
+GENERATION_STATUS_FINAL_TTL = 300
+FINAL_GENERATION_STATUSES = (GenerationStatus.COMPLETED, GenerationStatus.FAILED)
+FINAL_GENERATION_STATUS_VALUES = tuple(final.value for final in FINAL_GENERATION_STATUSES)
+
+# How long an identical submission is answered with the in-flight generation
+GENERATION_INFLIGHT_TTL = 600
+
+# Caps in-flight create_generation requests per process so bursts queue
+# briefly instead of exhausting the DB pool and the Gemini quota
+_generation_slots = asyncio.Semaphore(settings.GENERATION_MAX_CONCURRENCY)
+
+async def generation_slot():
+    """Hold one generation slot for the request, or 429 if none frees up in time"""
+    try:
+        await asyncio.wait_for(_generation_slots.acquire(), timeout=settings.GENERATION_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied. Admin privileges required."
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many generation requests in progress. Please try again shortly.",
+            headers={"Retry-After": str(max(1, round(settings.GENERATION_QUEUE_TIMEOUT)))}
         )
-    
-    # Create access token
-    access_token = AuthService.create_token(user)
-    
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user": {
-            "id": user.id,
-            "email": user.email,
-            "full_name": user.full_name,
-            "is_admin": user.is_admin
-        }
-    }
+    try:
+        yield
+    finally:
+        _generation_slots.release()
 
-# ============= TEMPLATE MANAGEMENT =============
-@router.post("/templates", response_model=TemplateResponse, status_code=status.HTTP_201_CREATED)
-async def create_template(
-    name: str = Form(...),
-    description: str = Form(...),
-    prompt: str = Form(...),
-    is_free: bool = Form(False),
-    display_order: int = Form(0),
-    price: Optional[float] = Form(0.0),           # ← ADD THIS
-    currency: Optional[str] = Form("INR"),
-    preview_image: Optional[UploadFile] = File(None),
-    current_admin: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
-):
-    """Create a new template with optional preview image (Admin only)"""
-    
-    print(f"Creating template: name={name}, description={description}, prompt={prompt}")
+def _status_cache_key(user_id: int, generation_id: int) -> str:
+    """Cache key for a user's generation status payload"""
+    return cache_service.make_key("generation", "status", user_id, generation_id)
+
+def _inflight_cache_key(user_id: int, template_id: int, mode: GenerationMode, digests: List[str]) -> str:
+    """Cache key identifying a submission by its template, mode and image contents"""
+    return cache_service.make_key("generation", "inflight", user_id, template_id, mode.value, "-".join(digests))
+
+async def _save_uploads(files: List[UploadFile]) -> List[Tuple[str, str]]:
+    """
+    Save uploads concurrently, returning (path, digest) per file in order
+    The files must already have passed validate_image_file (the mode
+    validators check every file before anything is written)
+    An identical file sent twice in one request (e.g. the same photo as both
+    user and partner image) is stored once and its path reused
+    """
+    results = await asyncio.gather(
+        *(StorageService.save_upload_file_with_digest(file, "uploads", validate=False) for file in files),
+        return_exceptions=True
+    )
+    
+    saved = [result for result in results if not isinstance(result, BaseException)]
+    failure = next((result for result in results if isinstance(result, BaseException)), None)
+    if failure is not None:
+        # Don't leave the uploads that did succeed behind
+        await StorageService.delete_files_async([path for path, _ in saved])
+        raise failure
+    
+    path_by_digest = {}
+    duplicates = []
+    deduped = []
+    for path, digest in saved:
+        if digest in path_by_digest:
+            duplicates.append(path)
+        else:
+            path_by_digest[digest] = path
+        deduped.append((path_by_digest[digest], digest))
+    
+    if duplicates:
+        await StorageService.delete_files_async(duplicates)
+    return deduped
+
+def _validate_flexible_images(
+    user_images: Optional[List[UploadFile]],
+    partner_images: Optional[List[UploadFile]],
+    couple_image: Optional[UploadFile]
+) -> None:
+    """FLEXIBLE: 1-3 user images + 1-3 partner images"""
+    # Validate: Must have at least 1 user image and 1 partner image
+    if not user_images or len(user_images) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least 1 user image is required for FLEXIBLE mode"
+        )
     
-    # Check if template name already exists
-    existing = db.query(Template).filter(Template.name == name).first()
-    if existing:
+    if not partner_images or len(partner_images) == 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Template with this name already exists"
+            detail="At least 1 partner image is required for FLEXIBLE mode"
         )
     
-    # Handle preview image upload
-    preview_image_path = None
-    if preview_image and preview_image.filename:
-        try:
-            StorageService.validate_image_file(preview_image)
-            preview_image_path = await StorageService.save_upload_file(
-                preview_image, 
-                settings.TEMPLATE_PREVIEW_DIR
-            )
-            print(f"Saved preview image: {preview_image_path}")
-        except Exception as e:
-            print(f"Error saving preview image: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Failed to save preview image: {str(e)}"
-            )
+    # Validate: Maximum 3 images per person
+    if len(user_images) > 3:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Maximum 3 user images allowed"
+        )
     
-    # Create template
-    try:
-        template = Template(
-            name=name,
-            description=description,
-            prompt=prompt,
-            preview_image=preview_image_path,
-            is_free=is_free,
-            display_order=display_order,
-            price=price,                 # ← ADD THIS
-            currency=currency
+    if len(partner_images) > 3:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Maximum 3 partner images allowed"
         )
-        
-        db.add(template)
-        db.commit()
-        db.refresh(template)
-        
-        print(f"Template created successfully: {template.id}")
-        return template
-    except Exception as e:
-        db.rollback()
-        print(f"Error creating template: {e}")
+    
+    for file in (*user_images, *partner_images):
+        StorageService.validate_image_file(file)
+
+def _validate_couple_image(
+    user_images: Optional[List[UploadFile]],
+    partner_images: Optional[List[UploadFile]],
+    couple_image: Optional[UploadFile]
+) -> None:
+    """COUPLE: one image with both people"""
+    if not couple_image:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to create template: {str(e)}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="couple_image is required for COUPLE mode"
         )
+    
+    StorageService.validate_image_file(couple_image)
 
-@router.put("/templates/{template_id}", response_model=TemplateResponse)
-async def update_template(
-    template_id: int,
-    name: Optional[str] = Form(None),
-    description: Optional[str] = Form(None),
-    prompt: Optional[str] = Form(None),
-    is_free: Optional[bool] = Form(None),
-    price: Optional[float] = Form(None),         # ← ADD THIS
-    currency: Optional[str] = Form(None),        # ← ADD THIS
-    display_order: Optional[int] = Form(None),
-    is_active: Optional[bool] = Form(None),
-    preview_image: Optional[UploadFile] = File(None),
-    current_admin: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+async def _save_flexible_images(
+    user_images: List[UploadFile],
+    partner_images: List[UploadFile],
+    couple_image: Optional[UploadFile]
 ):
-    """Update a template (Admin only)"""
-    
-    template = db.query(Template).filter(Template.id == template_id).first()
-    if not template:
+    """Save FLEXIBLE uploads -> (user paths, partner paths, None, digests)"""
+    # Save all images at once so their writes/uploads overlap
+    saved = await _save_uploads([*user_images, *partner_images])
+    user_images_paths = [path for path, _ in saved[:len(user_images)]]
+    partner_images_paths = [path for path, _ in saved[len(user_images):]]
+    
+    logger.info(f"📸 FLEXIBLE mode: {len(user_images_paths)} user + {len(partner_images_paths)} partner images")
+    return user_images_paths, partner_images_paths, None, [digest for _, digest in saved]
+
+async def _save_couple_image(
+    user_images: Optional[List[UploadFile]],
+    partner_images: Optional[List[UploadFile]],
+    couple_image: UploadFile
+):
+    """Save the COUPLE upload -> (None, None, couple path, digests)"""
+    couple_image_path, digest = await StorageService.save_upload_file_with_digest(
+        couple_image, "uploads", validate=False
+    )
+    logger.info(f"📸 COUPLE mode: {couple_image_path}")
+    return None, None, couple_image_path, [digest]
+
+# Form value -> mode, built once at import
+GENERATION_MODES_BY_VALUE = {mode.value: mode for mode in GenerationMode}
+
+# Per-mode upload handling, looked up once instead of branching in the handler
+GENERATION_MODE_VALIDATORS = {
+    GenerationMode.FLEXIBLE: _validate_flexible_images,
+    GenerationMode.COUPLE: _validate_couple_image,
+}
+GENERATION_MODE_SAVERS = {
+    GenerationMode.FLEXIBLE: _save_flexible_images,
+    GenerationMode.COUPLE: _save_couple_image,
+}
+
+# Columns behind a GenerationResponse, for endpoints that build it without loading entities
+GENERATION_RESPONSE_COLUMNS = (
+    Generation.id,
+    Generation.template_id,
+    Generation.generation_mode,
+    Generation.user_images,
+    Generation.partner_images,
+    Generation.couple_image_path,
+    Generation.generated_image_path,
+    Generation.watermarked_image_path,
+    Generation.status,
+    Generation.error_message,
+    Generation.has_watermark,
+    Generation.was_free_generation,
+    Generation.created_at,
+    Generation.completed_at,
+)
+
+def _url_context(request: Request) -> dict:
+    """Base URLs for building response URLs, resolved once per request"""
+    return {
+        "base_url": StorageService.get_base_url(request),
+        "api_base_url": str(request.base_url).rstrip('/')
+    }
+
+def _get_user_generation(db: Session, generation_id: int, user_id: int) -> Generation:
+    """
+    Fetch one of the user's generations or raise 404
+    Single 2.0-style statement shared by the per-generation endpoints, so its
+    compiled form is reused from the engine's statement cache
+    """
+    generation = db.execute(
+        select(Generation)
+        .options(raiseload("*"))
+        .where(Generation.id == generation_id, Generation.user_id == user_id)
+    ).scalar_one_or_none()
+    
+    if not generation:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Template not found"
+            detail="Generation not found"
         )
-    
-    # Update fields
-    if name is not None:
-        template.name = name
-    if description is not None:
-        template.description = description
-    if prompt is not None:
-        template.prompt = prompt
-    if is_free is not None:
-        template.is_free = is_free
-    if display_order is not None:
-        template.display_order = display_order
-    if is_active is not None:
-        template.is_active = is_active
+    return generation
+
+def _insufficient_credits() -> HTTPException:
+    """403 for a free-template generation without a free credit left"""
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail={
+            "error": "insufficient_credits",
+            "message": "No free credits remaining.",
+            "free_credits_remaining": 0
+        }
+    )
+
+def _reserve_generation_access(db: Session, user_id: int, template: dict):
+    """
+    Spend a free credit or reserve a paid token for the template
+    Nothing is committed here; _reserve_and_insert_generation commits it
+    together with the generation row (or rolls back).
+    
+    Returns:
+        (payment_token_id, used_free_credit, used_paid_token)
+    """
+    template_id = template["id"]
+    
+    # ============================================
+    # ACCESS CONTROL
+    # ============================================
+    payment_token_id = None
+    used_free_credit = False
+    used_paid_token = False
+    
+    if template["is_free"]:
+        # Check-and-deduct in one statement so concurrent requests cannot
+        # both spend the last credit
+        credits_left = db.execute(
+            update(User)
+            .where(User.id == user_id, User.free_credits_remaining > 0)
+            .values(free_credits_remaining=User.free_credits_remaining - 1)
+            .returning(User.free_credits_remaining)
+        ).scalar()
+        if credits_left is None:
+            raise _insufficient_credits()
         
-    if price is not None:         # ← ADD THIS
-        template.price = price
-    if currency is not None:      # ← ADD THIS
-        template.currency = currency
-    
-    # Handle preview image update
-    if preview_image and preview_image.filename:
-        # Delete old preview if exists
-        if template.preview_image:
-            try:
-                StorageService.delete_file(template.preview_image)
-            except Exception as e:
-                print(f"Error deleting old preview: {e}")
+        used_free_credit = True
+        logger.info(f"💳 FREE: Credit deducted. User {user_id} has {credits_left} credits")
         
-        # Upload new preview
-        try:
-            StorageService.validate_image_file(preview_image)
-            new_preview_path = await StorageService.save_upload_file(
-                preview_image,
-                settings.TEMPLATE_PREVIEW_DIR
+    else:
+        # Reserve one unused token atomically; SKIP LOCKED lets concurrent
+        # requests claim different tokens instead of racing for the same one
+        unused_token = (
+            select(PaymentToken.id)
+            .where(
+                PaymentToken.user_id == user_id,
+                PaymentToken.template_id == template_id,
+                PaymentToken.status == TokenStatus.UNUSED,
+                PaymentToken.payment_status == PaymentStatus.COMPLETED
             )
-            template.preview_image = new_preview_path
-        except Exception as e:
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        token_id = db.execute(
+            update(PaymentToken)
+            .where(PaymentToken.id == unused_token)
+            .values(status=TokenStatus.RESERVED)
+            .returning(PaymentToken.id)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        if token_id is None:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Failed to save preview image: {str(e)}"
+                status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                detail={
+                    "error": "payment_required",
+                    "message": f"Payment required for template: {template['name']}",
+                    "template_price": template["price"]
+                }
             )
+        
+        payment_token_id = token_id
+        used_paid_token = True
+        logger.info(f"💳 PAID: Using token {token_id}")
     
+    return payment_token_id, used_free_credit, used_paid_token
+
+def _get_inflight_generation(db: Session, generation_id: int, user_id: int) -> Optional[Generation]:
+    """
+    Return the user's generation if it is still pending/processing
+    Runs before anything is spent, so a duplicate has nothing to undo; the
+    read is committed straight away (not rolled back, which would expire the
+    loaded user and generation) to hand the connection back to the pool
+    """
+    existing = db.execute(
+        select(Generation)
+        .options(raiseload("*"))
+        .where(
+            Generation.id == generation_id,
+            Generation.user_id == user_id,
+            Generation.status.in_((GenerationStatus.PENDING, GenerationStatus.PROCESSING))
+        )
+    ).scalar_one_or_none()
+    db.commit()
+    return existing
+
+def _reserve_and_insert_generation(
+    db: Session,
+    generation: Generation,
+    template: dict,
+    usage_counted: bool
+) -> None:
+    """
+    Spend the credit/token and insert the generation in one short transaction
+    with a single commit - it opens only after the uploads are stored, so no
+    row lock or pooled connection is held across upload I/O. On a 402/403
+    nothing is written.
+    """
     try:
-        db.commit()
-        db.refresh(template)
-        return template
-    except Exception as e:
+        generation.payment_token_id, generation.used_free_credit, generation.used_paid_token = (
+            _reserve_generation_access(db, generation.user_id, template)
+        )
+        _insert_generation(db, generation, usage_counted)
+    except Exception:
         db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to update template: {str(e)}"
+        raise
+
+def _insert_generation(db: Session, generation: Generation, usage_counted: bool) -> None:
+    """Insert the generation and commit it together with the credit/token spend"""
+    # The flush INSERTs with RETURNING for the id; Python-side defaults are
+    # already on the instance, so no refresh SELECT is needed after commit
+    db.add(generation)
+    db.flush()
+    
+    if not usage_counted:
+        # Update template usage (atomic increment, no read-modify-write)
+        db.execute(
+            update(Template)
+            .where(Template.id == generation.template_id)
+            .values(usage_count=Template.usage_count + 1)
         )
+    
+    db.commit()
+
+def _fail_unqueued_generation(db: Session, generation: Generation, usage_counted: bool) -> None:
+    """
+    Mark a generation that never reached the queue FAILED and return its
+    credit/token; without Redis, also take back the usage_count increment
+    """
+    generation.status = GenerationStatus.FAILED
+    generation.error_message = "Failed to queue generation"
+    if not usage_counted:
+        db.execute(
+            update(Template)
+            .where(Template.id == generation.template_id)
+            .values(usage_count=Template.usage_count - 1)
+        )
+    if generation.used_free_credit:
+        db.execute(
+            update(User)
+            .where(User.id == generation.user_id)
+            .values(free_credits_remaining=User.free_credits_remaining + 1)
+        )
+    if generation.payment_token_id:
+        db.execute(
+            update(PaymentToken)
+            .where(PaymentToken.id == generation.payment_token_id)
+            .values(status=TokenStatus.UNUSED)
+        )
+    db.commit()
 
-@router.delete("/templates/{template_id}")
-async def delete_template(
-    template_id: int,
-    current_admin: User = Depends(get_current_admin),
+@router.post("/", response_model=GenerationResponse, status_code=status.HTTP_201_CREATED)
+async def create_generation(
+    request: Request,
+    template_id: int = Form(...),
+    generation_mode: str = Form(...),  # "flexible" or "couple"
+    
+    # Mode 1: FLEXIBLE (1-3 images per person)
+    user_images: List[UploadFile] = File(None),
+    partner_images: List[UploadFile] = File(None),
+    
+    # Mode 2: COUPLE (1 image with both)
+    couple_image: Optional[UploadFile] = File(None),
+    
+    # Declared before the user lookup so waiting requests hold no DB connection
+    _slot: None = Depends(generation_slot),
+    current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Archive a template (Admin only) - Soft delete to archive"""
+    """
+    Create a new image generation request with support for 2 modes:
     
-    template = db.query(Template).filter(Template.id == template_id).first()
-    if not template:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Template not found"
-        )
+    - FLEXIBLE: 1-3 user images + 1-3 partner images (auto-detect count)
+    - COUPLE: 1 image with both people together
+    """
     
-    # Check if already archived
-    if template.is_archived:
+    # Validate generation mode
+    mode = GENERATION_MODES_BY_VALUE.get(generation_mode.lower())
+    if mode is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Template is already archived"
+            detail=f"Invalid generation mode. Must be: 'flexible' or 'couple'"
         )
     
-    # Archive the template
-    template.is_archived = True
-    template.archived_at = datetime.utcnow()
-    template.is_active = False  # Also deactivate
+    # Reject bad uploads before any credit or token is touched
+    GENERATION_MODE_VALIDATORS[mode](user_images, partner_images, couple_image)
+    
+    template = await TemplateService.get_fields_cached(db, template_id)
+    
+    # Reject a free generation without credits from the already-loaded user,
+    # before any upload is written; the conditional UPDATE at reservation
+    # time stays authoritative
+    if template["is_free"] and current_user.free_credits_remaining <= 0:
+        raise _insufficient_credits()
+    
+    # End the read transaction the user/template lookups opened, so no pooled
+    # connection is held through the upload I/O (commit, not rollback: the
+    # session does not expire loaded objects on commit)
+    await asyncio.to_thread(db.commit)
+    
+    # ============================================
+    # SAVE IMAGES (already validated for the mode)
+    # ============================================
+    
+    # Stored before any credit/token is touched: the DB transaction below
+    # then lasts only for the reservation and the insert
+    user_images_paths, partner_images_paths, couple_image_path, image_digests = (
+        await GENERATION_MODE_SAVERS[mode](user_images, partner_images, couple_image)
+    )
+    saved_paths = (user_images_paths or []) + (partner_images_paths or []) + ([couple_image_path] if couple_image_path else [])
+    
+    # ============================================
+    # DEDUPE RESUBMISSIONS OF AN IN-FLIGHT GENERATION
+    # ============================================
+    
+    # A double-submit or client retry with the same photos would spend a second
+    # credit and a second model call; hand back the generation already queued
+    inflight_key = _inflight_cache_key(current_user.id, template_id, mode, image_digests)
+    inflight_id = await cache_service.get_json(inflight_key)
+    if inflight_id is not None:
+        existing = await asyncio.to_thread(_get_inflight_generation, db, inflight_id, current_user.id)
+        if existing:
+            # Nothing was spent for this request; drop the duplicate uploads
+            await StorageService.delete_files_async(saved_paths)
+            logger.info(f"♻️ Duplicate submission for generation {existing.id}, returning it")
+            return GenerationResponse.model_validate(existing, context=_url_context(request))
+    
+    # Watermark logic
+    add_watermark = not template["is_free"] and not current_user.is_subscribed
+    
+    # ============================================
+    # CREATE GENERATION RECORD
+    # ============================================
+    
+    generation = Generation(
+        user_id=current_user.id,
+        template_id=template_id,
+        generation_mode=mode,
+        
+        # Mode 1: FLEXIBLE
+        user_images=user_images_paths,
+        partner_images=partner_images_paths,
+        
+        # Mode 2: COUPLE
+        couple_image_path=couple_image_path,
+        
+        status=GenerationStatus.PENDING,
+        has_watermark=add_watermark
+    )
+    
+    # Count template usage in Redis; the worker folds the deltas into
+    # templates.usage_count periodically instead of every generation locking
+    # the same hot row. Without Redis, fall back to the atomic UPDATE.
+    usage_key = cache_service.make_key("template", "usage", template_id)
+    usage_counted = await cache_service.incr(usage_key) is not None
     
+    # Credit/token spend + insert: one transaction, one commit (blocking DB calls)
     try:
-        db.commit()
-        return {
-            "message": "Template archived successfully",
-            "template_id": template_id,
-            "archived_at": template.archived_at
-        }
+        await asyncio.to_thread(_reserve_and_insert_generation, db, generation, template, usage_counted)
+    except Exception:
+        # No credit/token available (or the insert failed) - undo the usage
+        # count and the uploads; the transaction is already rolled back
+        if usage_counted:
+            await cache_service.incr(usage_key, -1)
+        await StorageService.delete_files_async(saved_paths)
+        raise
+    
+    # ============================================
+    # QUEUE GENERATION ON THE WORKER (only after commit)
+    # ============================================
+    
+    try:
+        # Publishing talks to the broker synchronously - keep it off the event loop
+        await asyncio.to_thread(
+            process_generation_task.delay,
+            generation.id,
+            payment_token_id=generation.payment_token_id
+        )
     except Exception as e:
-        db.rollback()
+        logger.error(f"❌ Failed to queue generation {generation.id}: {str(e)}", exc_info=True)
+        
+        # Nothing will pick this generation up - fail it, give the credit back
+        # and undo the usage count
+        await asyncio.to_thread(_fail_unqueued_generation, db, generation, usage_counted)
+        if usage_counted:
+            await cache_service.incr(usage_key, -1)
+        
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to archive template: {str(e)}"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Generation service is temporarily unavailable. Please try again."
         )
+    
+    await cache_service.set_json(inflight_key, generation.id, ttl=GENERATION_INFLIGHT_TTL)
+    
+    # Return response
+    return GenerationResponse.model_validate(generation, context=_url_context(request))
 
-@router.post("/templates/{template_id}/restore")
-async def restore_template(
-    template_id: int,
-    current_admin: User = Depends(get_current_admin),
+
+@router.get("/", response_model=GenerationListResponse)
+async def get_user_generations(
+    request: Request,
+    skip: int = 0,
+    limit: int = 50,
+    current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Restore an archived template (Admin only)"""
+    """Get all generations for current user"""
+    # Page and total count in one round trip via a window count; plain
+    # column rows skip ORM entity hydration entirely
+    stmt = (
+        select(*GENERATION_RESPONSE_COLUMNS, func.count().over().label("total"))
+        .where(Generation.user_id == current_user.id)
+        .order_by(Generation.created_at.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+    rows = db.execute(stmt).mappings().all()
+    
+    if rows:
+        total = rows[0]["total"]
+    elif skip:
+        # Page past the end - the window count has no row to ride on; a plain
+        # COUNT on the (user_id, created_at) index, not Query.count()'s subquery
+        total = db.execute(
+            select(func.count()).select_from(Generation).where(Generation.user_id == current_user.id)
+        ).scalar_one()
+    else:
+        total = 0
+    
+    # Build plain dicts and hand them straight to orjson - no per-row model
+    # validation; base URLs are resolved once for the whole page
+    url_context = _url_context(request)
+    generation_responses = []
+    for row in rows:
+        data = dict(row)
+        del data["total"]
+        data.update(build_generation_urls(data, url_context["base_url"], url_context["api_base_url"]))
+        generation_responses.append(data)
+    
+    return ORJSONResponse({
+        "generations": generation_responses,
+        "total": total
+    })
+
+
+@router.get("/{generation_id}", response_model=GenerationResponse)
+async def get_generation(
+    request: Request,
+    generation_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get a specific generation"""
+    generation = _get_user_generation(db, generation_id, current_user.id)
     
-    template = db.query(Template).filter(Template.id == template_id).first()
-    if not template:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Template not found"
+    return GenerationResponse.model_validate(generation, context=_url_context(request))
+
+
+@router.get("/{generation_id}/status")
+async def get_generation_status(
+    request: Request,
+    response: Response,
+    generation_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get generation status for polling"""
+    cache_key = _status_cache_key(current_user.id, generation_id)
+    
+    # Polls are served from a short-lived cache entry; finished generations
+    # never change, so theirs is kept longer
+    payload = await cache_service.get_json(cache_key)
+    if payload is None:
+        # Only the polled columns - a plain row skips ORM hydration and
+        # identity-map bookkeeping on this hot path
+        generation = db.execute(
+            select(
+                Generation.id,
+                Generation.status,
+                Generation.generation_mode,
+                Generation.generated_image_path,
+                Generation.watermarked_image_path,
+                Generation.error_message,
+                Generation.used_free_credit,
+                Generation.used_paid_token
+            ).where(Generation.id == generation_id, Generation.user_id == current_user.id)
+        ).one_or_none()
+        if generation is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Generation not found"
+            )
+        
+        image_path = None
+        if generation.status == GenerationStatus.COMPLETED:
+            image_path = generation.watermarked_image_path or generation.generated_image_path
+        
+        payload = {
+            "id": generation.id,
+            "status": generation.status.value,
+            "generation_mode": generation.generation_mode.value,
+            "image_path": image_path,
+            "error_message": generation.error_message,
+            "used_free_credit": generation.used_free_credit,
+            "used_paid_token": generation.used_paid_token
+        }
+        is_final = generation.status in FINAL_GENERATION_STATUSES
+        await cache_service.set_json(
+            cache_key,
+            payload,
+            ttl=GENERATION_STATUS_FINAL_TTL if is_final else GENERATION_STATUS_POLL_TTL
         )
     
-    if not template.is_archived:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Template is not archived"
-        )
+    # Unchanged status -> 304, no body to rebuild or send
+    etag = f'W/"{payload["id"]}-{payload["status"]}"'
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
     
-    # Restore the template
-    template.is_archived = False
-    template.archived_at = None
-    template.is_active = True  # Reactivate
+    response.headers["ETag"] = etag
+    if payload["status"] not in FINAL_GENERATION_STATUS_VALUES:
+        # Hint for clients to back off between polls
+        response.headers["Retry-After"] = str(GENERATION_STATUS_POLL_TTL)
     
-    try:
-        db.commit()
-        db.refresh(template)
-        return {
-            "message": "Template restored successfully",
-            "template": template
-        }
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to restore template: {str(e)}"
-        )
+    return {
+        "id": payload["id"],
+        "status": payload["status"],
+        "generation_mode": payload["generation_mode"],
+        "generated_image_url": StorageService.get_file_url(payload["image_path"], request),
+        "error_message": payload["error_message"],
+        "used_free_credit": payload["used_free_credit"],
+        "used_paid_token": payload["used_paid_token"]
+    }
+
 
-@router.delete("/templates/{template_id}/permanent")
-async def permanently_delete_template(
-    template_id: int,
-    current_admin: User = Depends(get_current_admin),
+@router.get("/{generation_id}/download")
+async def download_generation(
+    generation_id: int,
+    include_watermark: bool = True,
+    current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Permanently delete a template (Admin only) - Can only delete archived templates"""
-    
-    template = db.query(Template).filter(Template.id == template_id).first()
-    if not template:
+    """Download generated image"""
+    # Generation and its template's name (for the filename) in one query;
+    # only the columns used here
+    generation = db.execute(
+        select(
+            Generation.id,
+            Generation.status,
+            Generation.generated_image_path,
+            Generation.watermarked_image_path,
+            Template.name.label("template_name")
+        )
+        .outerjoin(Template, Template.id == Generation.template_id)
+        .where(Generation.id == generation_id, Generation.user_id == current_user.id)
+    ).one_or_none()
+    if generation is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Template not found"
+            detail="Generation not found"
         )
     
-    # Only allow permanent deletion of archived templates
-    if not template.is_archived:
+    if generation.status != GenerationStatus.COMPLETED:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Template must be archived before permanent deletion. Archive it first."
+            detail=f"Generation is not completed yet. Current status: {generation.status}"
         )
     
-    # Delete preview image if exists
-    if template.preview_image:
-        try:
-            StorageService.delete_file(template.preview_image)
-        except Exception as e:
-            print(f"Error deleting preview image: {e}")
-    
-    # Permanently delete from database
-    try:
-        db.delete(template)
-        db.commit()
-        return {
-            "message": "Template permanently deleted",
-            "template_id": template_id
-        }
-    except Exception as e:
-        db.rollback()
+    # Determine which image to download
+    if include_watermark and generation.watermarked_image_path:
+        file_path = generation.watermarked_image_path
+        filename_suffix = "_watermarked"
+    elif generation.generated_image_path:
+        file_path = generation.generated_image_path
+        filename_suffix = ""
+    else:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to permanently delete template: {str(e)}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Generated image not found"
         )
-
-@router.get("/templates/all")
-async def get_all_templates_admin(
-    include_inactive: bool = False,
-    show_archived: bool = False,
-    current_admin: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
-):
-    """Get all templates (Admin only) - Excludes archived by default"""
-    
-    query = db.query(Template)
-    
-    # By default, exclude archived templates
-    if not show_archived:
-        query = query.filter(Template.is_archived == False)
-    
-    # Filter by active status
-    if not include_inactive and not show_archived:
-        query = query.filter(Template.is_active == True)
-    
-    templates = query.order_by(Template.display_order).all()
-    
-    # Add full URL for preview images
-    templates_data = []
-    for template in templates:
-        template_dict = {
-            "id": template.id,
-            "name": template.name,
-            "description": template.description,
-            "prompt": template.prompt,
-            "preview_image": template.preview_image,
-            "preview_url": StorageService.get_file_url(template.preview_image) if template.preview_image else None,
-            "is_free": template.is_free,
-            "is_active": template.is_active,
-            "price":template.price,
-            "currency":template.currency,
-            "is_archived": template.is_archived,
-            "archived_at": template.archived_at,
-            "display_order": template.display_order,
-            "usage_count": template.usage_count,
-            "created_at": template.created_at,
-            "updated_at": template.updated_at
-        }
-        templates_data.append(template_dict)
     
-    return {
-        "templates": templates_data,
-        "total": len(templates_data)
-    }
-
-@router.get("/templates/archived")
-async def get_archived_templates(
-    current_admin: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
-):
-    """Get all archived templates (Admin only)"""
-    
-    templates = db.query(Template).filter(
-        Template.is_archived == True
-    ).order_by(Template.archived_at.desc()).all()
-    
-    # Add full URL for preview images
-    templates_data = []
-    for template in templates:
-        template_dict = {
-            "id": template.id,
-            "name": template.name,
-            "description": template.description,
-            "prompt": template.prompt,
-            "preview_image": template.preview_image,
-            "preview_url": StorageService.get_file_url(template.preview_image) if template.preview_image else None,
-            "is_free": template.is_free,
-            "is_active": template.is_active,
-            "price":template.price,
-            "currency":template.currency,
-            "is_archived": template.is_archived,
-            "archived_at": template.archived_at,
-            "display_order": template.display_order,
-            "usage_count": template.usage_count,
-            "created_at": template.created_at,
-            "updated_at": template.updated_at
-        }
-        templates_data.append(template_dict)
+    template_name = generation.template_name.replace(" ", "_") if generation.template_name else "template"
     
-    return {
-        "templates": templates_data,
-        "total": len(templates_data)
-    }
-
-# ============= STATISTICS =============
-@router.get("/stats")
-async def get_admin_stats(
-    current_admin: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
-):
-    """Get admin dashboard statistics"""
-    from app.models.generation import Generation
-    
-    total_users = db.query(User).count()
-    total_generations = db.query(Generation).count()
-    total_templates = db.query(Template).filter(
-        Template.is_active == True,
-        Template.is_archived == False
-    ).count()
-    subscribed_users = db.query(User).filter(User.is_subscribed == True).count()
-    archived_templates = db.query(Template).filter(Template.is_archived == True).count()
+    # Create download filename
+    file_extension = os.path.splitext(file_path)[1]
+    download_filename = f"{template_name}_generation_{generation.id}{filename_suffix}{file_extension}"
     
-    return {
-        "total_users": total_users,
-        "total_generations": total_generations,
-        "total_templates": total_templates,
-        "subscribed_users": subscribed_users,
-        "archived_templates": archived_templates
-    }
+    logger.info(f"📥 User {current_user.id} downloading generation {generation.id}: {download_filename}")
+    
+    if settings.USE_S3:
+        # Send the client to S3 with a signed link instead of streaming the
+        # bytes through the API; S3 itself answers 404 for a missing object
+        cache_key = cache_service.make_key("generation", "download", download_filename)
+        download_url = await cache_service.get_json(cache_key)
+        if download_url is None:
+            download_url = s3_service.generate_presigned_url(
+                file_path,
+                settings.S3_PRESIGNED_URL_EXPIRY,
+                download_filename
+            )
+            await cache_service.set_json(cache_key, download_url, ttl=settings.S3_PRESIGNED_URL_CACHE_TTL)
+        
+        # A cached link can be up to the cache TTL old, so the browser may keep
+        # it only for what is guaranteed to remain of its lifetime
+        max_age = settings.S3_PRESIGNED_URL_EXPIRY - settings.S3_PRESIGNED_URL_CACHE_TTL
+        return RedirectResponse(
+            url=download_url,
+            status_code=status.HTTP_302_FOUND,
+            headers={"Cache-Control": f"private, max-age={max_age}"}
+        )
+    
+    # One stat: it both verifies the file and is handed to FileResponse, which
+    # would otherwise stat again for Content-Length / Last-Modified
+    try:
+        stat_result = os.stat(file_path)
+    except FileNotFoundError:
+        logger.error(f"File not found on disk: {file_path}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image file not found on server"
+        )
+    
+    # FileResponse writes Content-Disposition from filename itself
+    return FileResponse(
+        path=file_path,
+        filename=download_filename,
+        media_type=mimetypes.guess_type(download_filename)[0] or "image/png",
+        stat_result=stat_result
+    )
 
-# ============= USER MANAGEMENT =============
-@router.get("/users")
-async def get_all_users(
-    skip: int = 0,
-    limit: int = 100,
-    current_admin: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
-):
-    """Get all users (Admin only)"""
-    users = db.query(User).offset(skip).limit(limit).all()
-    return {
-        "users": users,
-        "total": db.query(User).count()
-    }
 
-@router.post("/users/{user_id}/grant-credits")
-async def grant_credits(
-    user_id: int,
-    credits: int,
-    current_admin: User = Depends(get_current_admin),
+@router.delete("/{generation_id}")
+async def delete_generation(
+    generation_id: int,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Grant credits to a user (Admin only)"""
-    
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    """Delete a generation and all associated files"""
+    # One DELETE ... RETURNING both removes the row and hands back the paths
+    # to clean up - no SELECT first; nothing references generations, so the
+    # unit of work has no cascades to run
+    generation = db.execute(
+        delete(Generation)
+        .where(Generation.id == generation_id, Generation.user_id == current_user.id)
+        .returning(Generation)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if generation is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
+            detail="Generation not found"
+        )
+    
+    # A paid generation still in flight holds its token RESERVED; the worker
+    # will not find the row, so hand the token back in the same transaction
+    if generation.payment_token_id and generation.status in (GenerationStatus.PENDING, GenerationStatus.PROCESSING):
+        db.execute(
+            update(PaymentToken)
+            .where(PaymentToken.id == generation.payment_token_id, PaymentToken.status == TokenStatus.RESERVED)
+            .values(status=TokenStatus.UNUSED)
+            .execution_options(synchronize_session=False)
         )
     
-    user.credits_remaining += credits
+    # Commit before any cleanup I/O so the connection goes back to the pool
     db.commit()
     
-    return {
-        "message": f"Granted {credits} credits to user",
-        "user_id": user.id,
-        "user_email": user.email,
-        "new_balance": user.credits_remaining
-    }
-
-# ============= ADMIN DASHBOARD PAGE =============
-@router.get("/dashboard", response_class=HTMLResponse)
-async def admin_dashboard():
-    """Serve the admin dashboard HTML page"""
-    dashboard_path = Path(__file__).parent.parent / "templates" / "admin_dashboard.html"
+    file_paths = generation.get_all_input_image_paths()
+    if generation.generated_image_path:
+        file_paths.append(generation.generated_image_path)
+    if generation.watermarked_image_path:
+        file_paths.append(generation.watermarked_image_path)
     
-    if not dashboard_path.exists():
-        raise HTTPException(status_code=404, detail="Admin dashboard not found")
+    # Storage cleanup runs on a Celery worker
+    await cache_service.delete(_status_cache_key(current_user.id, generation_id))
+    try:
+        await asyncio.to_thread(cleanup_generation_files_task.delay, file_paths)
+    except Exception as e:
+        # Broker unavailable - clean up in-process after the response instead
+        logger.warning(f"⚠️ Could not queue file cleanup for generation {generation_id}: {str(e)}")
+        background_tasks.add_task(StorageService.delete_files_async, file_paths)
     
-    return FileResponse(dashboard_path)
\ No newline at end of file
+    return {"message": "Generation deleted successfully"}
\ No newline at end of file
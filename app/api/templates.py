@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Header
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Header, Response
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 from typing import Optional
 from app.database import get_db
 from app.models.template import Template
 from app.models.user import User
-from app.schemas.template import TemplateResponse, TemplateListResponse, TemplateListItem
+from app.schemas.template import TemplateResponse, TemplateListResponse, template_list_adapter
 from app.utils.dependencies import get_current_user
+from app.utils.http_cache import etag_matches
+from app.services.storage_service import StorageService
+from app.services.template_service import TemplateService
 
 
 router = APIRouter(prefix="/api/templates", tags=["Templates"])
@@ -37,65 +41,57 @@ async def get_templates(
     db: Session = Depends(get_db)
 ):
     """Get all active templates (requires login)"""
-    query = db.query(Template).filter(Template.is_active == True)
+    # Page and total in one round trip via a window count
+    rows = db.execute(
+        select(Template, func.count().over().label("total"))
+        .where(Template.is_active == True)
+        .order_by(Template.display_order)
+        .offset(skip)
+        .limit(limit)
+    ).all()
+    templates = [row[0] for row in rows]
     
-    templates = query.order_by(Template.display_order).offset(skip).limit(limit).all()
-    total = query.count()
+    if rows:
+        total = rows[0].total
+    elif skip:
+        # Page past the end - no row to carry the window count
+        total = db.execute(
+            select(func.count()).select_from(Template).where(Template.is_active == True)
+        ).scalar_one()
+    else:
+        total = 0
     
-    template_responses = []
-    for template in templates:
-        response = TemplateListItem.model_validate(template)
-        response._request = request
-        template_responses.append(response)
+    url_context = {"base_url": StorageService.get_base_url(request)}
+    template_responses = template_list_adapter.validate_python(
+        templates, from_attributes=True, context=url_context
+    )
     
     return {"templates": template_responses, "total": total}
 
 
-# -----------------------------------------------------
-# AUTHENTICATED: SINGLE TEMPLATE
-# -----------------------------------------------------
-@router.get("/{template_id}", response_model=TemplateResponse)
-async def get_template(
-    request: Request,
-    template_id: int,
-    current_user: User = Depends(get_current_user),  # Authentication required
-    db: Session = Depends(get_db)
-):
-    """Get specific template detail (requires login)"""
-    template = db.query(Template).filter(
-        Template.id == template_id,
-        Template.is_active == True
-    ).first()
-    
-    if not template:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Template not found")
-    
-    response = TemplateResponse.model_validate(template)
-    response._request = request
-    return response
+async def _public_template_list_response(request: Request, db: Session) -> Response:
+    """
+    Cached public listing with an ETag; an unchanged listing is answered 304
+    without a body. The body is already serialized, so it bypasses
+    response_model validation.
+    """
+    body, etag = await TemplateService.get_public_list_cached(db, StorageService.get_base_url(request))
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
 
 # -----------------------------------------------------
 # PUBLIC: ALL TEMPLATES (FREE + PAID)
 # -----------------------------------------------------
+# (registered before /{template_id}, which would otherwise capture /public)
 @router.get("/public", response_model=TemplateListResponse)
 async def get_public_templates(
     request: Request,
     db: Session = Depends(get_db)
 ):
     """Public endpoint - anyone can view all templates"""
-    
-    templates = db.query(Template).filter(
-        Template.is_active == True
-    ).order_by(Template.display_order).all()
-
-    template_responses = []
-    for template in templates:
-        response = TemplateListItem.model_validate(template)
-        response._request = request
-        response.is_paid = not template.is_free  # ← Changed from requires_login
-        template_responses.append(response)
-
-    return {"templates": template_responses, "total": len(template_responses)}  
+    return await _public_template_list_response(request, db)
 
 # -----------------------------------------------------
 # PUBLIC: FREE TEMPLATES ONLY
@@ -106,23 +102,30 @@ async def get_free_templates(
     db: Session = Depends(get_db)
 ):
     """Public endpoint - now returns ALL templates (free + paid)"""
-    
-    templates = db.query(Template).filter(
+    return await _public_template_list_response(request, db)
+
+
+# -----------------------------------------------------
+# AUTHENTICATED: SINGLE TEMPLATE
+# -----------------------------------------------------
+@router.get("/{template_id}", response_model=TemplateResponse)
+async def get_template(
+    request: Request,
+    template_id: int,
+    current_user: User = Depends(get_current_user),  # Authentication required
+    db: Session = Depends(get_db)
+):
+    """Get specific template detail (requires login)"""
+    template = db.query(Template).filter(
+        Template.id == template_id,
         Template.is_active == True
-    ).order_by(Template.display_order).all()
+    ).first()
     
-    template_responses = []
-    for template in templates:
-        response = TemplateListItem.model_validate(template)
-        response._request = request
-        response.is_paid = not template.is_free  # ← Changed from requires_login
-        template_responses.append(response)
+    if not template:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Template not found")
     
-    return {
-        "templates": template_responses,
-        "total": len(template_responses)
-    }
-
+    response = TemplateResponse.model_validate(template, context={"base_url": StorageService.get_base_url(request)})
+    return response
 
 # -----------------------------------------------------
 # AUTHENTICATED: CHECK ACCESS
@@ -135,21 +138,20 @@ async def check_template_access(
 ):
     """Check if user can access a template"""
     
-    template = db.query(Template).filter(Template.id == template_id).first()
-    
-    if not template:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Template not found")
+    # The user fields are already loaded; only is_free needs the template,
+    # read through the same Redis cache as create_generation (404 if missing)
+    template = await TemplateService.get_fields_cached(db, template_id)
     
     can_access = (
-        template.is_free or 
+        template["is_free"] or 
         current_user.is_subscribed or 
         current_user.credits_remaining > 0
     )
     
     return {
         "can_access": can_access,
-        "is_free": template.is_free,
-        "requires_subscription": not template.is_free,
+        "is_free": template["is_free"],
+        "requires_subscription": not template["is_free"],
         "user_credits": current_user.credits_remaining,
         "user_subscribed": current_user.is_subscribed
     }
@@ -99,7 +99,7 @@ async def simulate_purchase(
     This creates a completed payment token without actual payment
     """
     
-    template = db.query(Template).filter(Template.id == template_id).first()
+    template = db.query(*PaymentService.ORDER_TEMPLATE_COLUMNS).filter(Template.id == template_id).first()
     if not template:
         return {"error": "Template not found"}
     
@@ -145,14 +145,16 @@ async def get_generation_history(
 ):
     """Check all generations and credit usage"""
     
-    generations = db.query(Generation).filter(
+    # Template fields come from the same query (one JOIN instead of a
+    # template lookup per generation)
+    rows = db.query(Generation, Template.name, Template.is_free).outerjoin(
+        Template, Template.id == Generation.template_id
+    ).filter(
         Generation.user_id == current_user.id
     ).order_by(Generation.created_at.desc()).limit(20).all()
     
     history = []
-    for gen in generations:
-        template = db.query(Template).filter(Template.id == gen.template_id).first()
-        
+    for gen, template_name, template_is_free in rows:
         credit_info = "Unknown"
         if gen.used_free_credit:
             credit_info = "Used FREE credit"
@@ -161,8 +163,8 @@ async def get_generation_history(
         
         history.append({
             "id": gen.id,
-            "template_name": template.name if template else "Unknown",
-            "is_free_template": template.is_free if template else None,
+            "template_name": template_name or "Unknown",
+            "is_free_template": template_is_free,
             "credit_used": credit_info,
             "status": gen.status.value,
             "created_at": gen.created_at.isoformat()
@@ -170,7 +172,7 @@ async def get_generation_history(
     
     return {
         "current_free_credits": current_user.free_credits_remaining,
-        "total_generations": len(generations),
+        "total_generations": len(rows),
         "generation_history": history
     }
 
@@ -4,6 +4,7 @@ Create file: app/api/test_payment.py
 """
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.user import User
@@ -33,9 +34,11 @@ class ManualVerifyRequest(BaseModel):
 # ============================================
 # TEST ENDPOINTS
 # ============================================
+# Plain (sync) handlers: every step is a blocking Session query or Razorpay
+# HTTP call, so FastAPI runs them in its threadpool instead of the event loop
 
 @router.get("/razorpay/credentials")
-async def test_razorpay_credentials():
+def test_razorpay_credentials():
     """
     Test if Razorpay credentials are valid
     No authentication required - just checks API keys
@@ -49,7 +52,7 @@ async def test_razorpay_credentials():
 
 
 @router.post("/payment/full-flow")
-async def test_full_payment_flow(
+def test_full_payment_flow(
     request: TestPaymentFlowRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -63,7 +66,7 @@ async def test_full_payment_flow(
     """
     
     # Get template
-    template = db.query(Template).filter(
+    template = db.query(*PaymentService.ORDER_TEMPLATE_COLUMNS).filter(
         Template.id == request.template_id,
         Template.is_free == False
     ).first()
@@ -111,7 +114,7 @@ async def test_full_payment_flow(
 
 
 @router.post("/payment/create-order-only")
-async def test_create_order(
+def test_create_order(
     request: TestPaymentFlowRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -120,7 +123,7 @@ async def test_create_order(
     Test ONLY order creation (useful for testing Razorpay API)
     """
     
-    template = db.query(Template).filter(
+    template = db.query(*PaymentService.ORDER_TEMPLATE_COLUMNS).filter(
         Template.id == request.template_id,
         Template.is_free == False
     ).first()
@@ -143,7 +146,7 @@ async def test_create_order(
 
 
 @router.post("/payment/verify-manual")
-async def test_manual_verification(
+def test_manual_verification(
     request: ManualVerifyRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -176,33 +179,50 @@ async def test_manual_verification(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/payment/my-test-tokens")
-async def get_test_tokens(
+@router.get("/payment/my-test-tokens", response_model=None)
+def get_test_tokens(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Get all payment tokens created during testing
     """
-    from app.models.payment_token import PaymentToken
+    from app.models.payment_token import PaymentToken, TokenStatus, PaymentStatus
     
-    tokens = db.query(PaymentToken).filter(
+    # Only the listed columns - no ORM entity hydration per token
+    tokens = db.query(
+        PaymentToken.id,
+        PaymentToken.template_id,
+        PaymentToken.amount_paid,
+        PaymentToken.status,
+        PaymentToken.payment_status,
+        PaymentToken.payment_id,
+        PaymentToken.created_at
+    ).filter(
         PaymentToken.user_id == current_user.id
     ).order_by(PaymentToken.created_at.desc()).all()
     
-    return {
+    # One pass: build each entry and count the usable tokens as we go
+    token_list = []
+    unused_count = 0
+    for t in tokens:
+        can_use = t.status == TokenStatus.UNUSED and t.payment_status == PaymentStatus.COMPLETED
+        if can_use:
+            unused_count += 1
+        token_list.append({
+            "token_id": t.id,
+            "template_id": t.template_id,
+            "amount": float(t.amount_paid),
+            "status": t.status.value,
+            "payment_status": t.payment_status.value,
+            "payment_id": t.payment_id,
+            "created_at": t.created_at,  # orjson encodes datetimes natively
+            "can_use": can_use
+        })
+    
+    # Straight to orjson - skips FastAPI's jsonable_encoder walk over the list
+    return ORJSONResponse({
         "total_tokens": len(tokens),
-        "tokens": [
-            {
-                "token_id": t.id,
-                "template_id": t.template_id,
-                "amount": float(t.amount_paid),
-                "status": t.status.value,
-                "payment_status": t.payment_status.value,
-                "payment_id": t.payment_id,
-                "created_at": t.created_at.isoformat(),
-                "can_use": t.status.value == "unused" and t.payment_status.value == "completed"
-            }
-            for t in tokens
-        ]
-    }
\ No newline at end of file
+        "unused_tokens": unused_count,
+        "tokens": token_list
+    })
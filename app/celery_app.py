@@ -1,10 +1,12 @@
 from celery import Celery
+from celery.signals import worker_process_init
 from app.config import settings
+from app.database import worker_engine
 
 celery_app = Celery(
     "image_generation_worker",
-    broker=settings.REDIS_URL,
-    backend=settings.REDIS_URL,
+    broker=settings.CELERY_BROKER_URL or settings.REDIS_URL,
+    backend=settings.CELERY_RESULT_BACKEND or settings.REDIS_URL,
     include=['app.celery_tasks']
 )
 
@@ -20,8 +22,35 @@ celery_app.conf.update(
     task_acks_late=True,
     task_reject_on_worker_lost=True,
     worker_prefetch_multiplier=1,  # One task at a time per worker
+
+    # Outcomes live in the database (generation status, usage_count) and the
+    # API never reads task results - skip the result-backend write per task
+    task_ignore_result=True,
     
     # Retry settings
     task_default_retry_delay=30,
     task_max_retries=3,
-)
\ No newline at end of file
+    
+    # Generation jobs get their own queue so those workers scale independently
+    task_routes={
+        "process_image_generation": {"queue": "generation"},
+    },
+    
+    # Fold Redis template usage counters into the database
+    beat_schedule={
+        "flush-template-usage": {
+            "task": "flush_template_usage",
+            "schedule": 10.0,
+        },
+    },
+    
+    # A hung Gemini call must not pin a worker forever
+    task_soft_time_limit=300,
+    task_time_limit=360,
+)
+
+
+@worker_process_init.connect
+def reset_db_pool(**kwargs):
+    """Drop pooled connections inherited from the parent across the prefork fork"""
+    worker_engine.dispose(close=False)
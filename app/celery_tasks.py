@@ -1,127 +1,231 @@
 from app.celery_app import celery_app
-from app.database import SessionLocal
-from app.models.generation import Generation, GenerationStatus, GenerationMode
-from app.models.payment_token import PaymentToken
-from app.services.image_generation_service import ImageGenerationService
+from app.database import WorkerSessionLocal
+from app.models.generation import Generation, GenerationStatus
+from app.models.payment_token import PaymentToken, TokenStatus
+from app.models.template import Template
+from app.services.cache_service import cache_service
+from app.services.image_generation_service import get_image_service
 from app.services.payment_service import PaymentService
-from datetime import datetime
-from pathlib import Path
-from typing import Optional, List
+from app.services.storage_service import StorageService
+from app.config import settings
+from sqlalchemy import select, update, func, case, exists
+from typing import List, Optional
+from functools import lru_cache
+import asyncio
 import logging
+import redis
 
 logger = logging.getLogger(__name__)
 
-@celery_app.task(bind=True, name="process_image_generation")
-def process_generation_task(
-    self,
-    generation_id: int,
-    generation_mode: str,
-    user_images: Optional[List[str]],
-    partner_images: Optional[List[str]],
-    couple_image_path: Optional[str],
-    prompt: str,
-    add_watermark: bool,
-):
+# Exponential backoff between attempts: 30s, 60s, 120s
+RETRY_BASE_DELAY = 30
+MAX_RETRIES = 3
+
+# Long-lived loop per worker process: the shared Gemini client's async
+# connections stay bound to it, so they are reused across tasks
+_event_loop = None
+
+def _run_async(coro):
+    """Run a coroutine on this worker process's persistent event loop"""
+    global _event_loop
+    if _event_loop is None or _event_loop.is_closed():
+        _event_loop = asyncio.new_event_loop()
+    return _event_loop.run_until_complete(coro)
+
+@celery_app.task(bind=True, name="process_image_generation", max_retries=MAX_RETRIES, acks_late=True)
+def process_generation_task(self, generation_id: int, *_legacy_args, payment_token_id: Optional[int] = None):
     """
     Celery task to process image generation
     This runs in a separate worker process
+
+    Only the generation id travels through the broker; input paths, mode,
+    watermark flag and the template prompt are read from the database.
+    (_legacy_args absorbs messages queued before that change.) The reserved
+    payment token id rides along so it can be released if the generation was
+    deleted before the worker got to it.
+
+    Transient failures are retried with exponential backoff; the generation is
+    only marked FAILED (and a paid token refunded) once retries are exhausted.
     """
-    db_session = SessionLocal()
-    generation = None
-    
-    try:
-        logger.info(f"🔄 [Worker {self.request.id}] Processing generation {generation_id}")
-        
-        # Get generation
-        generation = db_session.query(Generation).filter(
-            Generation.id == generation_id
-        ).first()
-        
-        if not generation:
-            logger.error(f"❌ Generation {generation_id} not found")
-            return
-        
-        # Update status
-        generation.status = GenerationStatus.PROCESSING
-        db_session.commit()
-        
-        # Convert string mode back to enum
-        mode = GenerationMode(generation_mode)
-        
-        # Verify files exist
-        if mode == GenerationMode.FLEXIBLE:
-            for i, path in enumerate(user_images, 1):
-                if not Path(path).exists():
-                    raise FileNotFoundError(f"User image {i} not found: {path}")
-            for i, path in enumerate(partner_images, 1):
-                if not Path(path).exists():
-                    raise FileNotFoundError(f"Partner image {i} not found: {path}")
-        
-        elif mode == GenerationMode.COUPLE:
-            if not Path(couple_image_path).exists():
-                raise FileNotFoundError(f"Couple image not found: {couple_image_path}")
-        
-        # Generate image (this is async but we run it sync in Celery)
-        logger.info(f"   🎨 Starting image generation...")
-        image_service = ImageGenerationService()
-        
-        # Run async function in sync context
-        import asyncio
-        generated_path, watermarked_path = asyncio.run(
-            image_service.generate_image(
-                generation_mode=mode,
-                user_images=user_images,
-                partner_images=partner_images,
-                couple_image_path=couple_image_path,
-                prompt=prompt,
-                add_watermark=add_watermark
-            )
-        )
-        
-        logger.info(f"   ✅ Generation complete!")
-        
-        # Update generation record
-        generation.generated_image_path = generated_path
-        generation.watermarked_image_path = watermarked_path
-        generation.status = GenerationStatus.COMPLETED
-        generation.completed_at = datetime.utcnow()
-        generation.has_watermark = add_watermark
-        
-        # Mark payment token as used
-        if generation.payment_token_id:
-            token = db_session.query(PaymentToken).filter(
-                PaymentToken.id == generation.payment_token_id
-            ).first()
-            if token:
-                token.mark_as_used()
-        
-        db_session.commit()
-        logger.info(f"✅ Generation {generation_id} completed successfully")
-        
-    except Exception as e:
-        logger.error(f"❌ Generation {generation_id} failed: {str(e)}")
-        logger.exception("Full traceback:")
-        
-        # Update with error
-        if generation:
-            generation.status = GenerationStatus.FAILED
-            generation.error_message = str(e)
+    with WorkerSessionLocal() as db_session:
+        generation = None
+
+        try:
+            logger.info("🔄 [Worker %s] Processing generation %s (attempt %s)", self.request.id, generation_id, self.request.retries + 1)
+
+            # Get generation together with its template's prompt (one query)
+            row = db_session.execute(
+                select(Generation, Template.prompt)
+                .outerjoin(Template, Template.id == Generation.template_id)
+                .where(Generation.id == generation_id)
+            ).one_or_none()
+
+            if row is None:
+                logger.error("❌ Generation %s not found", generation_id)
+                if payment_token_id:
+                    # Deleted while queued: give back a token still RESERVED
+                    # that no other generation has claimed since
+                    released = db_session.execute(
+                        update(PaymentToken)
+                        .where(
+                            PaymentToken.id == payment_token_id,
+                            PaymentToken.status == TokenStatus.RESERVED,
+                            ~exists().where(Generation.payment_token_id == payment_token_id)
+                        )
+                        .values(status=TokenStatus.UNUSED)
+                        .execution_options(synchronize_session=False)
+                    ).rowcount
+                    db_session.commit()
+                    if released:
+                        logger.info("   💰 Released token %s of deleted generation %s", payment_token_id, generation_id)
+                return
+            generation, prompt = row
+
+            # Update status
+            generation.status = GenerationStatus.PROCESSING
             db_session.commit()
-            
-            # REFUND if paid generation failed
+
+            if prompt is None:
+                raise ValueError(f"Template {generation.template_id} not found")
+
+            # No up-front existence checks: the inputs were written moments ago,
+            # and a missing one raises FileNotFoundError when it is opened
+
+            # Generate image (async service driven from the sync worker)
+            logger.info("   🎨 Starting image generation...")
+            image_service = get_image_service()
+            generated_path, watermarked_path = _run_async(
+                image_service.generate_image(
+                    generation_mode=generation.generation_mode,
+                    user_images=generation.user_images,
+                    partner_images=generation.partner_images,
+                    couple_image_path=generation.couple_image_path,
+                    prompt=prompt,
+                    add_watermark=generation.has_watermark
+                )
+            )
+
+            logger.info("   ✅ Generation complete!")
+
+            # Update generation record
+            generation.generated_image_path = generated_path
+            generation.watermarked_image_path = watermarked_path
+            generation.status = GenerationStatus.COMPLETED
+            generation.completed_at = func.timezone('UTC', func.now())  # stamped by the database in UTC
+
+            # Mark payment token as used - a plain UPDATE, no token SELECT;
+            # result and token land in the same single commit. Only a token
+            # still held for generation (UNUSED for reservations made before
+            # RESERVED existed) is consumed; a refunded/expired/used one is
+            # never flipped to USED
             if generation.payment_token_id:
-                try:
-                    PaymentService.refund_payment(
-                        generation.payment_token_id,
-                        f"Generation failed: {str(e)}",
-                        db_session
+                consumed = db_session.execute(
+                    update(PaymentToken)
+                    .where(
+                        PaymentToken.id == generation.payment_token_id,
+                        PaymentToken.status.in_((TokenStatus.RESERVED, TokenStatus.UNUSED))
                     )
-                    logger.info(f"   💰 Payment refunded for failed generation")
-                except Exception as refund_error:
-                    logger.error(f"   ❌ Refund failed: {str(refund_error)}")
-        
-        # Re-raise for Celery retry mechanism
-        raise self.retry(exc=e, countdown=60, max_retries=3)
-    
-    finally:
-        db_session.close()
\ No newline at end of file
+                    .values(status=TokenStatus.USED, used_at=func.timezone('UTC', func.now()))
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if not consumed:
+                    logger.warning("⚠️ Token %s for generation %s was no longer held for it", generation.payment_token_id, generation_id)
+
+            db_session.commit()
+            logger.info("✅ Generation %s completed successfully", generation_id)
+
+        except Exception as e:
+            db_session.rollback()
+
+            # Missing inputs will not appear on a retry
+            retryable = not isinstance(e, FileNotFoundError)
+            if generation and retryable and self.request.retries < self.max_retries:
+                countdown = RETRY_BASE_DELAY * (2 ** self.request.retries)
+                logger.warning("⚠️ Generation %s failed, retrying in %ss: %s", generation_id, countdown, e)
+
+                generation.status = GenerationStatus.PENDING
+                db_session.commit()
+                raise self.retry(exc=e, countdown=countdown)
+
+            # One record carrying the message and the traceback, formatted once
+            logger.exception("❌ Generation %s failed: %s", generation_id, e)
+
+            # Update with error
+            if generation:
+                generation.status = GenerationStatus.FAILED
+                generation.error_message = str(e)
+                db_session.commit()
+
+                # REFUND if paid generation failed
+                if generation.payment_token_id:
+                    try:
+                        PaymentService.refund_payment(
+                            generation.payment_token_id,
+                            f"Generation failed: {str(e)}",
+                            db_session
+                        )
+                        logger.info("   💰 Payment refunded for failed generation")
+                    except Exception as refund_error:
+                        logger.error("   ❌ Refund failed: %s", refund_error)
+
+
+@celery_app.task(name="cleanup_generation_files")
+def cleanup_generation_files_task(file_paths: List[str]):
+    """Delete a deleted generation's stored images (S3 batched, or local unlinks)"""
+    deleted = StorageService.delete_files(file_paths)
+    logger.info("🗑️ Cleaned up %s/%s generation files", deleted, len(file_paths))
+    return deleted
+
+
+@lru_cache(maxsize=1)
+def _redis_client() -> redis.Redis:
+    """Sync Redis client (and its connection pool) shared by this worker process"""
+    return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+
+@celery_app.task(name="flush_template_usage")
+def flush_template_usage_task():
+    """
+    Fold the Redis template usage counters into templates.usage_count
+    Runs periodically from celery beat; each counter is read and removed
+    atomically (GETDEL), and put back if the database write fails.
+    """
+    client = _redis_client()
+    keys = list(client.scan_iter(match=cache_service.make_key("template", "usage", "*"), count=500))
+    if not keys:
+        return 0
+
+    # Read-and-remove every counter in one round trip
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.getdel(key)
+    deltas = {
+        int(key.rsplit(":", 1)[1]): int(value)
+        for key, value in zip(keys, pipe.execute())
+        if value and int(value)
+    }
+
+    if not deltas:
+        return 0
+
+    with WorkerSessionLocal() as db_session:
+        try:
+            # Single UPDATE for all templates: usage_count + CASE id WHEN ... END
+            db_session.execute(
+                update(Template)
+                .where(Template.id.in_(deltas))
+                .values(usage_count=Template.usage_count + case(deltas, value=Template.id, else_=0))
+                .execution_options(synchronize_session=False)
+            )
+            db_session.commit()
+        except Exception as e:
+            db_session.rollback()
+            logger.error("❌ Template usage flush failed, restoring counters: %s", e)
+            pipe = client.pipeline(transaction=False)
+            for template_id, delta in deltas.items():
+                pipe.incrby(cache_service.make_key("template", "usage", template_id), delta)
+            pipe.execute()
+            raise
+
+    logger.info("📊 Flushed usage counts for %s templates", len(deltas))
+    return len(deltas)
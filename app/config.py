@@ -13,10 +13,14 @@ class Settings(BaseSettings):
     # DATABASE
     # ============================================
     DATABASE_URL: str
-    DB_POOL_SIZE: int = 10
-    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_SIZE: int = 20  # Sized for Uvicorn worker concurrency
+    DB_MAX_OVERFLOW: int = 40
     DB_POOL_TIMEOUT: int = 30
-    DB_POOL_RECYCLE: int = 3600
+    DB_POOL_RECYCLE: int = 1800  # Recycle before server-side idle timeouts
+    DB_QUERY_CACHE_SIZE: int = 1200  # Compiled SQL statement cache entries
+    # Separate, smaller pool per Celery worker process (one task at a time)
+    WORKER_DB_POOL_SIZE: int = 2
+    WORKER_DB_MAX_OVERFLOW: int = 2
     
     # ============================================
     # SECURITY
@@ -59,12 +63,17 @@ class Settings(BaseSettings):
     AWS_SECRET_ACCESS_KEY: Optional[str] = None
     S3_BUCKET_NAME: Optional[str] = None
     S3_ENDPOINT_URL: Optional[str] = None  # For LocalStack testing
+    S3_PRESIGNED_URL_EXPIRY: int = 3600  # Download links (seconds)
+    S3_PRESIGNED_URL_CACHE_TTL: int = 300  # Reuse a signed link for this long
     
     # Local storage (fallback/development)
     TEMPLATE_PREVIEW_DIR: str = "template_previews"
     UPLOAD_DIR: str = "./uploads"
     GENERATED_DIR: str = "./generated"
     MAX_FILE_SIZE: int = 10485760  # 10MB
+    MAX_REQUEST_SIZE: int = 67108864  # 64MB - up to 6 images plus form fields
+    GENERATION_MAX_CONCURRENCY: int = 32  # create_generation requests handled at once per process
+    GENERATION_QUEUE_TIMEOUT: float = 10.0  # seconds to wait for a slot before answering 429
     
     # ============================================
     # URLS
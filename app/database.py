@@ -32,6 +32,7 @@ engine_kwargs = {
     "pool_timeout": settings.DB_POOL_TIMEOUT,
     "pool_recycle": settings.DB_POOL_RECYCLE,
     "pool_pre_ping": True,  # Test connections before using
+    "query_cache_size": settings.DB_QUERY_CACHE_SIZE,
     "echo": settings.DEBUG,  # Log SQL queries in debug mode
 }
 
@@ -44,6 +45,17 @@ if settings.is_production and "postgresql" in settings.DATABASE_URL:
 
 engine = create_engine(settings.DATABASE_URL, **engine_kwargs)
 
+# Background workers get their own engine/pool so slow generation jobs never
+# hold connections the API needs (no connections are opened until first use)
+worker_engine = create_engine(
+    settings.DATABASE_URL,
+    **{
+        **engine_kwargs,
+        "pool_size": settings.WORKER_DB_POOL_SIZE,
+        "max_overflow": settings.WORKER_DB_MAX_OVERFLOW,
+    }
+)
+
 # ============================================
 # SESSION CONFIGURATION
 # ============================================
@@ -55,6 +67,13 @@ SessionLocal = sessionmaker(
     expire_on_commit=False  # Prevent detached instance errors
 )
 
+WorkerSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=worker_engine,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 # ============================================
@@ -3,7 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from pathlib import Path
 import logging
 import sys
@@ -11,7 +11,8 @@ from contextlib import asynccontextmanager
 
 from app.config import settings
 from app.database import engine, Base, check_db_connection, get_pool_status
-from app.api import auth, templates, generation, admin, test, payment, test_payment
+from app.api import auth, templates, generation, admin, test, test_payment
+from app.middleware.content_size_limit import ContentSizeLimitMiddleware
 import app.models
 
 # ============================================
@@ -40,9 +41,12 @@ Path("app/templates").mkdir(parents=True, exist_ok=True)
 app = FastAPI(
     title="Wedding Image Generator API",
     description="Pre-wedding image generation service",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse  # orjson: faster encoding for list payloads
 )
 
+app.add_middleware(ContentSizeLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     #allow_origins=[settings.FRONTEND_URL, "http://localhost:5173"],
@@ -59,12 +63,12 @@ app.add_middleware(
 app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
 app.mount("/generated", StaticFiles(directory=settings.GENERATED_DIR), name="generated")
 app.mount("/template_previews", StaticFiles(directory=settings.TEMPLATE_PREVIEW_DIR), name="template_previews")
+app.mount("/api/admin/static", StaticFiles(directory="app/templates"), name="admin-static")
 
 app.include_router(auth.router)
 app.include_router(templates.router)
 app.include_router(generation.router)
 app.include_router(admin.router)
-app.include_router(payment.router)
 app.include_router(test.router)
 app.include_router(test_payment.router)
 
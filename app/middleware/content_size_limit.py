@@ -0,0 +1,27 @@
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ContentSizeLimitMiddleware(BaseHTTPMiddleware):
+    """
+    Reject requests whose declared Content-Length exceeds MAX_REQUEST_SIZE
+    - Runs before the body is read, so oversized uploads are never spooled
+    - Chunked bodies without a length are bounded per file by StorageService
+    """
+    
+    async def dispatch(self, request: Request, call_next):
+        content_length = request.headers.get("content-length")
+        
+        if content_length and content_length.isdigit() and int(content_length) > settings.MAX_REQUEST_SIZE:
+            logger.warning(f"🚫 Request body too large: {content_length} bytes on {request.url.path}")
+            max_size_mb = settings.MAX_REQUEST_SIZE / 1024 / 1024
+            return JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": f"Request too large. Maximum size: {max_size_mb:.1f}MB"}
+            )
+        
+        return await call_next(request)
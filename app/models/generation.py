@@ -1,6 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Text, Boolean, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Text, Boolean, JSON, Index, func
 from sqlalchemy.orm import relationship
-from datetime import datetime
 from app.database import Base
 import enum
 
@@ -17,7 +16,9 @@ class GenerationMode(str, enum.Enum):
 class Generation(Base):
     __tablename__ = "generations"
     
-    id = Column(Integer, primary_key=True, index=True)
+    # Single-generation routes filter on id AND user_id: the primary key finds
+    # the row and user_id is checked on it, so no extra (user_id, id) index
+    id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     template_id = Column(Integer, ForeignKey("templates.id"), nullable=False)
     payment_token_id = Column(Integer, ForeignKey("payment_tokens.id"), nullable=True)
@@ -57,7 +58,7 @@ class Generation(Base):
     used_free_credit = Column(Boolean, default=False)
     used_paid_token = Column(Boolean, default=False)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.timezone('UTC', func.now()))  # stamped by the database, in UTC
     completed_at = Column(DateTime, nullable=True)
     
     # Relationships
@@ -65,6 +66,17 @@ class Generation(Base):
     template = relationship("Template", back_populates="generations")
     payment_token = relationship("PaymentToken", back_populates="generation")
     
+    __table_args__ = (
+        # Backs the per-user history listing and its count (filter by user, newest first)
+        Index("ix_generations_user_created", user_id, created_at.desc()),
+        # FK lookups when a template is deleted (ORM collection load + FK check)
+        Index("ix_generations_template_id", template_id),
+    )
+    
+    # Fetch server-generated values (created_at) in the INSERT's RETURNING
+    # instead of a follow-up SELECT
+    __mapper_args__ = {"eager_defaults": True}
+    
     def get_all_input_image_paths(self) -> list[str]:
         """Get all input image paths for cleanup"""
         paths = []
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Numeric
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Numeric, Index, func
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -6,6 +6,7 @@ import enum
 
 class TokenStatus(str, enum.Enum):
     UNUSED = "unused"
+    RESERVED = "reserved"  # Claimed by an in-flight generation
     USED = "used"
     REFUNDED = "refunded"
     EXPIRED = "expired"
@@ -37,9 +38,16 @@ class PaymentToken(Base):
     template = relationship("Template", back_populates="payment_tokens")
     generation = relationship("Generation", back_populates="payment_token", uselist=False)
 
+    __table_args__ = (
+        # Backs per-user token lookups (unused + completed tokens for credits/access checks)
+        Index("ix_payment_tokens_user_status", user_id, status, payment_status),
+    )
+
     def mark_as_used(self, generation_id: int = None):
         self.status = TokenStatus.USED
-        self.used_at = datetime.utcnow()
+        # Stamped by the database in the UPDATE, in UTC like the utcnow() columns
+        # (naive DateTime: plain now() would follow the session TimeZone)
+        self.used_at = func.timezone('UTC', func.now())
         if generation_id:
             self.generation_id = generation_id
 
@@ -49,4 +57,4 @@ class PaymentToken(Base):
         self.payment_status = PaymentStatus.REFUNDED
         self.refund_id = refund_id
         self.refund_reason = reason
-        self.refunded_at = datetime.utcnow()
+        self.refunded_at = func.timezone('UTC', func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Text, DateTime, Numeric
+from sqlalchemy import Column, Integer, String, Boolean, Text, DateTime, Numeric, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -35,4 +35,19 @@ class Template(Base):
     
     # Relationships
     generations = relationship("Generation", back_populates="template")
-    payment_tokens = relationship("PaymentToken", back_populates="template")
\ No newline at end of file
+    payment_tokens = relationship("PaymentToken", back_populates="template")
+    
+    __table_args__ = (
+        # Backs the active/archived listings ordered by display_order
+        Index("ix_templates_archived_order", is_archived, is_active, display_order),
+        # Backs the archived listing (newest archive first)
+        Index("ix_templates_archived_at", is_archived, archived_at.desc()),
+        # Backs the user-facing listings (WHERE is_active ORDER BY display_order);
+        # partial, so archived/inactive templates never enter it
+        Index(
+            "ix_templates_active_order",
+            display_order,
+            postgresql_where=(is_active == True),
+            sqlite_where=(is_active == True)
+        ),
+    )
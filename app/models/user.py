@@ -85,13 +85,3 @@ class User(Base):
              and token.payment_status == PaymentStatus.COMPLETED),
             None
         )
-    
-    def deduct_free_credit(self) -> bool:
-        """
-        Deduct 1 free credit
-        Returns True if successful, False if no credits available
-        """
-        if self.free_credits_remaining > 0:
-            self.free_credits_remaining -= 1
-            return True
-        return False
\ No newline at end of file
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, computed_field, Field
-from typing import Optional, List
+from pydantic import BaseModel, Field, ValidationInfo, model_validator
+from typing import Any, Mapping, Optional, List
 from datetime import datetime
 from app.models.generation import GenerationStatus, GenerationMode
 
@@ -7,6 +7,36 @@ class GenerationCreate(BaseModel):
     template_id: int
     generation_mode: GenerationMode = GenerationMode.FLEXIBLE
 
+GENERATION_PATH_FIELDS = {
+    "id", "status", "user_images", "partner_images",
+    "couple_image_path", "generated_image_path", "watermarked_image_path"
+}
+
+def build_generation_urls(data: Mapping[str, Any], base_url: Optional[str], api_base_url: Optional[str]) -> dict:
+    """
+    URL fields of a GenerationResponse from its path fields
+    base_url serves stored files (defaults to the backend URL); download_url
+    needs api_base_url and is only set for completed generations
+    """
+    from app.services.storage_service import StorageService
+    if base_url is None:
+        base_url = StorageService.get_base_url()
+    
+    def file_url(path):
+        return StorageService.get_file_url(path, base_url=base_url)
+    
+    return {
+        "user_images_urls": [file_url(path) for path in data["user_images"]] if data["user_images"] else None,
+        "partner_images_urls": [file_url(path) for path in data["partner_images"]] if data["partner_images"] else None,
+        "couple_image_url": file_url(data["couple_image_path"]),
+        "generated_image_url": file_url(data["generated_image_path"]),
+        "watermarked_image_url": file_url(data["watermarked_image_path"]),
+        "download_url": (
+            f"{api_base_url}/api/generate/{data['id']}/download"
+            if api_base_url and data["status"] == GenerationStatus.COMPLETED else None
+        ),
+    }
+
 class GenerationResponse(BaseModel):
     id: int
     template_id: int
@@ -32,77 +62,28 @@ class GenerationResponse(BaseModel):
     created_at: datetime
     completed_at: Optional[datetime] = None
     
-    # Store request for URL generation
-    _request: Optional[object] = None
-    
-    # ============================================
-    # Computed fields for URLs - FLEXIBLE mode
-    # ============================================
-    @computed_field
-    @property
-    def user_images_urls(self) -> Optional[List[str]]:
-        """Convert user images paths to URLs"""
-        if self.user_images:
-            from app.services.storage_service import StorageService
-            return [
-                StorageService.get_file_url(path, self._request)
-                for path in self.user_images
-            ]
-        return None
-    
-    @computed_field
-    @property
-    def partner_images_urls(self) -> Optional[List[str]]:
-        """Convert partner images paths to URLs"""
-        if self.partner_images:
-            from app.services.storage_service import StorageService
-            return [
-                StorageService.get_file_url(path, self._request)
-                for path in self.partner_images
-            ]
-        return None
-    
-    # ============================================
-    # Computed fields for URLs - COUPLE mode
-    # ============================================
-    @computed_field
-    @property
-    def couple_image_url(self) -> Optional[str]:
-        """Convert couple image path to full URL"""
-        if self.couple_image_path:
-            from app.services.storage_service import StorageService
-            return StorageService.get_file_url(self.couple_image_path, self._request)
-        return None
-    
-    # ============================================
-    # Output image URLs
-    # ============================================
-    @computed_field
-    @property
-    def generated_image_url(self) -> Optional[str]:
-        """Convert generated image path to full URL"""
-        if self.generated_image_path:
-            from app.services.storage_service import StorageService
-            return StorageService.get_file_url(self.generated_image_path, self._request)
-        return None
-    
-    @computed_field
-    @property
-    def watermarked_image_url(self) -> Optional[str]:
-        """Convert watermarked image path to full URL"""
-        if self.watermarked_image_path:
-            from app.services.storage_service import StorageService
-            return StorageService.get_file_url(self.watermarked_image_path, self._request)
-        return None
+    # URLs - filled in from the path fields at validation time; pass
+    # context={"base_url": ..., "api_base_url": ...} to model_validate
+    user_images_urls: Optional[List[str]] = None
+    partner_images_urls: Optional[List[str]] = None
+    couple_image_url: Optional[str] = None
+    generated_image_url: Optional[str] = None
+    watermarked_image_url: Optional[str] = None
+    download_url: Optional[str] = None
     
-    @computed_field
-    @property
-    def download_url(self) -> Optional[str]:
-        """Get download URL for the final image"""
-        if self._request and self.status == GenerationStatus.COMPLETED:
-            base_url = str(self._request.base_url).rstrip('/')
-            return f"{base_url}/api/generate/{self.id}/download"
-        return None
+    @model_validator(mode="after")
+    def fill_urls(self, info: ValidationInfo):
+        """Build the URL fields once, from base URLs resolved by the caller"""
+        context = info.context or {}
+        urls = build_generation_urls(
+            {field: getattr(self, field) for field in GENERATION_PATH_FIELDS},
+            context.get("base_url"),
+            context.get("api_base_url")
+        )
+        for field, url in urls.items():
+            if getattr(self, field) is None:
+                setattr(self, field, url)
+        return self
     
     class Config:
         from_attributes = True
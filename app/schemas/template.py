@@ -1,5 +1,5 @@
 # schemas/template.py
-from pydantic import BaseModel, Field, computed_field
+from pydantic import BaseModel, Field, TypeAdapter, ValidationInfo, model_validator
 from typing import Optional, List
 from datetime import datetime
 
@@ -35,18 +35,18 @@ class TemplateResponse(TemplateBase):
     created_at: datetime
     updated_at: datetime
     
-    # Store request for URL generation
-    _request: Optional[object] = None
+    # Filled in from preview_image at validation time; pass
+    # context={"base_url": ...} to model_validate for a request-specific host
+    preview_url: Optional[str] = None
     
-    # Computed field for preview URL
-    @computed_field
-    @property
-    def preview_url(self) -> Optional[str]:
+    @model_validator(mode="after")
+    def fill_preview_url(self, info: ValidationInfo):
         """Convert preview image path to full URL"""
-        if self.preview_image:
+        if self.preview_url is None and self.preview_image:
             from app.services.storage_service import StorageService
-            return StorageService.get_file_url(self.preview_image, self._request)
-        return None
+            base_url = (info.context or {}).get("base_url")
+            self.preview_url = StorageService.get_file_url(self.preview_image, base_url=base_url)
+        return self
     
     class Config:
         from_attributes = True
@@ -60,6 +60,10 @@ class TemplateListItem(TemplateResponse):
         from_attributes = True
         arbitrary_types_allowed = True
 
+# Validates a whole result list in one pydantic-core call instead of a
+# model_validate per row; pass from_attributes=True and the URL context
+template_list_adapter = TypeAdapter(List[TemplateListItem])
+
 class TemplateListResponse(BaseModel):
     templates: List[TemplateListItem]
     total: int
@@ -1,4 +1,5 @@
 import logging
+from sqlalchemy import select, Row
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 from google.oauth2 import id_token
@@ -10,6 +11,18 @@ from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Columns needed to verify a password login and issue a token
+LOGIN_COLUMNS = (
+    User.id,
+    User.email,
+    User.hashed_password,
+    User.is_admin,
+    User.full_name,
+    User.is_subscribed,
+    User.auth_provider,
+    User.is_active,
+)
+
 class AuthService:
     @staticmethod
     def register_user(db: Session, user_data: UserCreate) -> User:
@@ -64,7 +77,7 @@ class AuthService:
             )
     
     @staticmethod
-    def authenticate_user(db: Session, email: str, password: str) -> User:
+    def authenticate_user(db: Session, email: str, password: str) -> Row:
         """
         Authenticate user with email and password
         
@@ -74,13 +87,16 @@ class AuthService:
             password: User password
             
         Returns:
-            User: Authenticated user object
+            Row: Authenticated user's login columns (see LOGIN_COLUMNS)
             
         Raises:
             HTTPException: If authentication fails
         """
         try:
-            user = db.query(User).filter(User.email == email).first()
+            # Read-only path: fetch just the login columns, skip ORM hydration
+            user = db.execute(
+                select(*LOGIN_COLUMNS).where(User.email == email)
+            ).first()
             
             if not user:
                 logger.warning(f"Login attempt for non-existent user: {email}")
@@ -207,12 +223,12 @@ class AuthService:
             )
     
     @staticmethod
-    def create_token(user: User) -> str:
+    def create_token(user: User | Row) -> str:
         """
         Create JWT access token for user
         
         Args:
-            user: User object
+            user: User object or row with an email column
             
         Returns:
             str: JWT access token
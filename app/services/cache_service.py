@@ -0,0 +1,95 @@
+import json
+import logging
+import time
+from typing import Any, Optional
+import redis.asyncio as aioredis
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class CacheService:
+    """
+    Small Redis-backed JSON cache
+    Every operation degrades to a cache miss / no-op when Redis is unavailable
+    """
+
+    KEY_PREFIX = "wp"
+    RECONNECT_INTERVAL = 30  # seconds between reconnect attempts
+
+    def __init__(self):
+        self.redis_client = None
+        self._next_connect_attempt = 0.0
+
+    async def get_client(self):
+        """Initialize Redis connection lazily"""
+        if self.redis_client is None and time.monotonic() >= self._next_connect_attempt:
+            try:
+                client = aioredis.from_url(
+                    settings.REDIS_URL,
+                    encoding="utf-8",
+                    decode_responses=True,
+                    max_connections=settings.REDIS_MAX_CONNECTIONS
+                )
+                await client.ping()
+                self.redis_client = client
+                logger.info("✅ Cache connected to Redis")
+            except Exception as e:
+                logger.warning(f"⚠️ Redis unavailable for caching: {e}")
+                self._next_connect_attempt = time.monotonic() + self.RECONNECT_INTERVAL
+        return self.redis_client
+
+    def make_key(self, *parts: Any) -> str:
+        """Build a namespaced cache key"""
+        return ":".join([self.KEY_PREFIX, *(str(part) for part in parts)])
+
+    async def get_json(self, key: str) -> Optional[Any]:
+        """Return the cached value or None on miss"""
+        client = await self.get_client()
+        if client is None:
+            return None
+        try:
+            cached = await client.get(key)
+            return json.loads(cached) if cached is not None else None
+        except Exception as e:
+            logger.warning(f"Cache read failed for {key}: {e}")
+            return None
+
+    async def set_json(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """Store a JSON-serializable value with a TTL"""
+        client = await self.get_client()
+        if client is None:
+            return
+        try:
+            await client.set(key, json.dumps(value, default=str), ex=ttl or settings.CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Cache write failed for {key}: {e}")
+
+    async def incr(self, key: str, amount: int = 1) -> Optional[int]:
+        """Atomically increment a counter; None when Redis is unavailable"""
+        client = await self.get_client()
+        if client is None:
+            return None
+        try:
+            return await client.incrby(key, amount)
+        except Exception as e:
+            logger.warning(f"Cache increment failed for {key}: {e}")
+            return None
+
+    async def delete(self, *keys: str) -> None:
+        """Invalidate one or more keys"""
+        client = await self.get_client()
+        if client is None or not keys:
+            return
+        try:
+            await client.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Cache invalidation failed for {keys}: {e}")
+
+
+# Global instance
+cache_service = CacheService()
+
+
+def template_cache_key(template_id: int) -> str:
+    """Cached template fields used by create_generation (invalidated by admin edits)"""
+    return cache_service.make_key("template", "row", template_id)
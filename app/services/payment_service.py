@@ -16,12 +16,31 @@ from app.models.template import Template
 import secrets
 import hmac
 import hashlib
+from functools import lru_cache
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+
+@lru_cache(maxsize=1)
+def _razorpay_client():
+    """
+    Razorpay client shared by this process
+    The client holds a requests.Session, so its pooled keep-alive connections
+    are reused across orders, verifications and refunds instead of paying a
+    new TLS handshake to api.razorpay.com on every call
+    """
+    import razorpay
+    
+    return razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+
+
 class PaymentService:
     
+    # The template fields an order needs - select these instead of loading
+    # the whole Template entity: db.query(*PaymentService.ORDER_TEMPLATE_COLUMNS)
+    ORDER_TEMPLATE_COLUMNS = (Template.id, Template.is_free, Template.price, Template.currency)
+    
     @staticmethod
     def _is_test_mode() -> bool:
         """Check if payment service is in test mode"""
@@ -38,7 +57,7 @@ class PaymentService:
         
         Args:
             user: User making the payment
-            template: Template being purchased
+            template: Template being purchased (or a row of ORDER_TEMPLATE_COLUMNS)
             db: Database session
             
         Returns:
@@ -64,9 +83,10 @@ class PaymentService:
                 status=TokenStatus.UNUSED
             )
             
+            # The INSERT returns the id; every other field is already set on
+            # the instance, so no refresh SELECT is needed after commit
             db.add(token)
             db.commit()
-            db.refresh(token)
             
             logger.info(f"Payment token created: {token.id} for user {user.id}, template {template.id}")
             
@@ -92,14 +112,11 @@ class PaymentService:
                 }
             
             # PRODUCTION MODE
-            import razorpay
-            
             if not settings.RAZORPAY_KEY_ID or not settings.RAZORPAY_KEY_SECRET:
                 logger.error("Razorpay credentials not configured")
                 raise Exception("Payment gateway not configured")
             
-            # Initialize Razorpay client
-            client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+            client = _razorpay_client()
             
             # Create order
             order_data = {
@@ -193,7 +210,7 @@ class PaymentService:
             
             import razorpay
             
-            client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+            client = _razorpay_client()
             
             # Verify signature
             params_dict = {
@@ -264,9 +281,7 @@ class PaymentService:
                 return True
             
             # PRODUCTION MODE
-            import razorpay
-            
-            client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+            client = _razorpay_client()
             
             logger.info(f"Processing refund for payment: {token.payment_id}")
             refund = client.payment.refund(token.payment_id, {
@@ -301,8 +316,6 @@ class PaymentService:
                     "test_mode": True
                 }
             
-            import razorpay
-            
             if not settings.RAZORPAY_KEY_ID or not settings.RAZORPAY_KEY_SECRET:
                 return {
                     "valid": False,
@@ -310,7 +323,7 @@ class PaymentService:
                     "test_mode": False
                 }
             
-            client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+            client = _razorpay_client()
             
             # Test API access
             client.order.all({'count': 1})
@@ -1,10 +1,12 @@
 import boto3
 import logging
 from pathlib import Path
-from typing import Optional, BinaryIO
+from typing import Optional, BinaryIO, List
 from botocore.exceptions import ClientError
 from app.config import settings
 import mimetypes
+import os
+import shutil
 import uuid
 
 logger = logging.getLogger(__name__)
@@ -26,6 +28,7 @@ class S3Service:
                     aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
                 )
                 self.bucket_name = settings.S3_BUCKET_NAME
+                self.public_url_prefix = f"https://{self.bucket_name}.s3.{settings.AWS_REGION}.amazonaws.com/"
                 logger.info(f"✅ S3 Service initialized - Bucket: {self.bucket_name}")
             except Exception as e:
                 logger.error(f"❌ Failed to initialize S3 client: {e}")
@@ -124,8 +127,9 @@ class S3Service:
             unique_filename = f"{uuid.uuid4()}{file_extension}"
             local_path = local_dir / unique_filename
             
+            # Copy in chunks rather than reading the whole object into memory
             with open(local_path, 'wb') as f:
-                f.write(file_obj.read())
+                shutil.copyfileobj(file_obj, f, 1024 * 1024)
             
             logger.debug(f"Saved locally: {local_path}")
             return str(local_path)
@@ -175,12 +179,12 @@ class S3Service:
         """
         if not settings.USE_S3:
             # Local deletion
+            # Unlink directly rather than checking existence first (one syscall)
             try:
-                path = Path(file_url_or_path)
-                if path.exists():
-                    path.unlink()
-                    logger.info(f"🗑️ Deleted local file: {file_url_or_path}")
-                    return True
+                os.unlink(file_url_or_path)
+                logger.info(f"🗑️ Deleted local file: {file_url_or_path}")
+                return True
+            except FileNotFoundError:
                 return False
             except Exception as e:
                 logger.error(f"❌ Failed to delete local file: {e}")
@@ -202,6 +206,46 @@ class S3Service:
             logger.error(f"❌ S3 deletion failed: {e}")
             return False
     
+    def delete_files(self, file_urls_or_paths: List[str]) -> int:
+        """
+        Delete several files from S3 or local storage
+        S3 uses one DeleteObjects request per 1000 keys instead of a call per file
+        
+        Args:
+            file_urls_or_paths: S3 URLs or local paths
+            
+        Returns:
+            int: Number of files deleted
+        """
+        # A generation may reference the same stored upload more than once
+        unique_paths = list(dict.fromkeys(file_urls_or_paths))
+        
+        if not settings.USE_S3:
+            return sum(self.delete_file(path) for path in unique_paths)
+        
+        keys = [self._extract_s3_key(path) for path in unique_paths]
+        deleted_count = 0
+        
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            try:
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={
+                        "Objects": [{"Key": key} for key in batch],
+                        "Quiet": True
+                    }
+                )
+                errors = response.get("Errors", [])
+                for error in errors:
+                    logger.error(f"❌ S3 deletion failed for {error.get('Key')}: {error.get('Message')}")
+                deleted_count += len(batch) - len(errors)
+            except Exception as e:
+                logger.error(f"❌ S3 batch deletion failed: {e}")
+        
+        logger.info(f"🗑️ Deleted {deleted_count}/{len(keys)} files from S3")
+        return deleted_count
+    
     def file_exists(self, file_url_or_path: str) -> bool:
         """
         Check if file exists in S3 or locally
@@ -270,7 +314,59 @@ class S3Service:
         if s3_key_or_path.startswith('http'):
             return s3_key_or_path
         
-        return f"https://{self.bucket_name}.s3.{settings.AWS_REGION}.amazonaws.com/{s3_key_or_path}"
+        return self.public_url_prefix + s3_key_or_path
+    
+    def read_file(self, file_url_or_key: str) -> bytes:
+        """
+        Read an object's bytes through the pooled S3 client
+        
+        Args:
+            file_url_or_key: S3 URL or key
+            
+        Returns:
+            bytes: Object contents
+            
+        Raises:
+            FileNotFoundError: If the object does not exist
+        """
+        s3_key = self._extract_s3_key(file_url_or_key)
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=s3_key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                raise FileNotFoundError(f"S3 object not found: {s3_key}")
+            raise
+        return response["Body"].read()
+    
+    def generate_presigned_url(
+        self,
+        file_url_or_key: str,
+        expires_in: int,
+        download_filename: Optional[str] = None
+    ) -> str:
+        """
+        Sign a time-limited GET URL so clients fetch the object straight from S3
+        
+        Args:
+            file_url_or_key: S3 URL or key
+            expires_in: Link lifetime in seconds
+            download_filename: If set, S3 serves the object as an attachment with this name
+            
+        Returns:
+            str: Presigned URL
+        """
+        params = {
+            "Bucket": self.bucket_name,
+            "Key": self._extract_s3_key(file_url_or_key)
+        }
+        if download_filename:
+            params["ResponseContentDisposition"] = f'attachment; filename="{download_filename}"'
+        
+        return self.s3_client.generate_presigned_url(
+            "get_object",
+            Params=params,
+            ExpiresIn=expires_in
+        )
     
     def test_connection(self) -> bool:
         """
@@ -1,16 +1,41 @@
 import os
 import uuid
-import aiofiles
+import hashlib
+import asyncio
+import shutil
 import logging
 from pathlib import Path
 from fastapi import UploadFile, HTTPException, Request
 from app.config import settings
 from app.services.s3_service import s3_service
-from typing import Optional
+from typing import Optional, List, Tuple, BinaryIO
 import tempfile
 
 logger = logging.getLogger(__name__)
 
+class _UploadTooLarge(Exception):
+    """Raised mid-stream once an upload passes MAX_FILE_SIZE"""
+
+class _HashingReader:
+    """
+    File-like wrapper that feeds every chunk read through a hasher and
+    enforces the upload size limit while the bytes stream out
+    """
+    
+    def __init__(self, file_obj: BinaryIO, hasher, max_bytes: int):
+        self._file_obj = file_obj
+        self._hasher = hasher
+        self._max_bytes = max_bytes
+        self.bytes_read = 0
+    
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._file_obj.read(size)
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self._max_bytes:
+            raise _UploadTooLarge()
+        self._hasher.update(chunk)
+        return chunk
+
 class StorageService:
     """
     Unified storage service supporting both local and S3 storage
@@ -25,6 +50,15 @@ class StorageService:
         '.webp': ['image/webp']
     }
     
+    # Chunk size used when streaming uploads to disk
+    UPLOAD_CHUNK_SIZE = 1024 * 1024
+    
+    # Local files live in <dir>/<first N chars of the name>/ subdirectories
+    LOCAL_SHARD_PREFIX_LENGTH = 2
+    
+    # Base URL for local files, resolved once (a request's host overrides it)
+    LOCAL_BASE_URL = settings.BACKEND_URL.rstrip('/')
+    
     @staticmethod
     async def save_upload_file(file: UploadFile, folder: str = "uploads") -> str:
         """
@@ -40,26 +74,50 @@ class StorageService:
         Raises:
             HTTPException: If file save fails
         """
+        path, _ = await StorageService.save_upload_file_with_digest(file, folder)
+        return path
+    
+    @staticmethod
+    async def save_upload_file_with_digest(
+        file: UploadFile,
+        folder: str = "uploads",
+        validate: bool = True
+    ) -> Tuple[str, str]:
+        """
+        Save uploaded file and return its content digest
+        The bytes are hashed (BLAKE2b) in the same pass that writes them out
+        
+        Args:
+            file: Uploaded file object
+            folder: Target folder ("uploads", "generated", or "template_previews")
+            validate: Run validate_image_file first (False when the caller
+                already validated the whole batch before saving any of it)
+            
+        Returns:
+            Tuple[str, str]: (S3 URL or local file path, hex digest)
+            
+        Raises:
+            HTTPException: If file save fails
+        """
+        hasher = hashlib.blake2b(digest_size=16)
         try:
             # Validate file first
-            StorageService.validate_image_file(file)
-            
-            # Read file content
-            content = await file.read()
+            if validate:
+                StorageService.validate_image_file(file)
             
             if settings.USE_S3:
-                # Upload to S3
-                from io import BytesIO
-                file_obj = BytesIO(content)
-                
-                s3_url = s3_service.upload_fileobj(
-                    file_obj=file_obj,
+                # Upload to S3 - boto3 streams the spooled file in parts; the
+                # blocking transfer runs in a thread so uploads can overlap
+                await file.seek(0)
+                s3_url = await asyncio.to_thread(
+                    s3_service.upload_fileobj,
+                    file_obj=_HashingReader(file.file, hasher, settings.MAX_FILE_SIZE),
                     filename=file.filename,
                     folder=folder
                 )
                 
                 logger.info(f"✅ File uploaded to S3: {s3_url}")
-                return s3_url
+                return s3_url, hasher.hexdigest()
                 
             else:
                 # Save locally
@@ -67,22 +125,32 @@ class StorageService:
                 if folder == "template_previews":
                     upload_dir = Path(settings.TEMPLATE_PREVIEW_DIR)
                     
-                upload_dir.mkdir(parents=True, exist_ok=True)
-                
                 # Generate unique filename
                 file_extension = os.path.splitext(file.filename)[1].lower()
                 unique_filename = f"{uuid.uuid4()}{file_extension}"
-                file_path = upload_dir / unique_filename
                 
-                # Save file
-                async with aiofiles.open(file_path, 'wb') as out_file:
-                    await out_file.write(content)
+                # Copy out of Starlette's spooled file in one worker-thread hop
+                # (not an executor round trip per chunk read and per chunk
+                # write), hashing and enforcing the size limit as bytes stream;
+                # the shard mkdir runs there too, so a request's files overlap
+                # completely when _save_uploads gathers them
+                await file.seek(0)
+                file_path, total_bytes = await asyncio.to_thread(
+                    StorageService._copy_to_local_file, file.file, upload_dir, unique_filename, hasher
+                )
                 
-                logger.info(f"✅ File saved locally: {file_path} ({len(content)} bytes)")
-                return str(file_path)
+                logger.info(f"✅ File saved locally: {file_path} ({total_bytes} bytes)")
+                return str(file_path), hasher.hexdigest()
             
         except HTTPException:
             raise
+        except _UploadTooLarge:
+            max_size_mb = settings.MAX_FILE_SIZE / 1024 / 1024
+            logger.warning(f"Upload exceeded size limit while streaming: {file.filename}")
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum size: {max_size_mb:.1f}MB"
+            )
         except Exception as e:
             logger.error(f"❌ Failed to save file: {str(e)}", exc_info=True)
             raise HTTPException(
@@ -90,6 +158,41 @@ class StorageService:
                 detail=f"Failed to save file: {str(e)}"
             )
     
+    @staticmethod
+    def _copy_to_local_file(file_obj: BinaryIO, directory: Path, filename: str, hasher) -> Tuple[Path, int]:
+        """
+        Blocking chunked copy of an upload into local storage (runs in a thread)
+        Returns (path, byte count); removes the partial file and raises
+        _UploadTooLarge once the upload passes MAX_FILE_SIZE
+        """
+        file_path = StorageService.local_file_path(directory, filename)
+        reader = _HashingReader(file_obj, hasher, settings.MAX_FILE_SIZE)
+        try:
+            with open(file_path, 'wb') as out_file:
+                shutil.copyfileobj(reader, out_file, StorageService.UPLOAD_CHUNK_SIZE)
+        except _UploadTooLarge:
+            file_path.unlink(missing_ok=True)
+            raise
+        return file_path, reader.bytes_read
+    
+    @staticmethod
+    def local_file_path(directory, filename: str) -> Path:
+        """
+        Path for a new local file, fanned out by the first two characters of
+        its (random, hex) name so no single directory grows unbounded;
+        creates the subdirectory. Paths already stored stay valid as-is.
+        
+        Args:
+            directory: Storage root (uploads, generated or template previews)
+            filename: Unique filename
+            
+        Returns:
+            Path: <directory>/<xx>/<filename>
+        """
+        shard_dir = Path(directory) / filename[:StorageService.LOCAL_SHARD_PREFIX_LENGTH]
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        return shard_dir / filename
+    
     @staticmethod
     def save_generated_image(image_path: str, folder: str = "generated") -> str:
         """
@@ -126,13 +229,31 @@ class StorageService:
             return image_path
     
     @staticmethod
-    def get_file_url(file_path: Optional[str], request: Optional[Request] = None) -> Optional[str]:
+    def get_base_url(request: Optional[Request] = None) -> str:
+        """
+        Base URL for local files - resolve once per request and pass it to
+        get_file_url when building many URLs
+        """
+        # Use request to get dynamic base URL (supports ngrok)
+        if request:
+            host = request.headers.get("host")
+            if host:
+                return f"{request.url.scheme}://{host}"
+        return StorageService.LOCAL_BASE_URL
+    
+    @staticmethod
+    def get_file_url(
+        file_path: Optional[str],
+        request: Optional[Request] = None,
+        base_url: Optional[str] = None
+    ) -> Optional[str]:
         """
         Convert file path/URL to accessible URL
         
         Args:
             file_path: S3 URL or local file path
             request: FastAPI request object (optional, for dynamic base URL)
+            base_url: Precomputed get_base_url() result (takes precedence over request)
             
         Returns:
             Optional[str]: Full URL to file or None if path is None
@@ -156,23 +277,14 @@ class StorageService:
             if normalized_path.startswith('./'):
                 normalized_path = normalized_path[2:]
             
-            # Get base URL
-            base_url = settings.BACKEND_URL
-            
-            # Use request to get dynamic base URL (supports ngrok)
-            if request:
-                scheme = request.url.scheme
-                host = request.headers.get("host")
-                if host:
-                    base_url = f"{scheme}://{host}"
-            
-            # Ensure proper URL format
-            base_url = base_url.rstrip('/')
             if not normalized_path.startswith('/'):
                 normalized_path = '/' + normalized_path
             
-            final_url = f"{base_url}{normalized_path}"
-            logger.debug(f"Generated file URL: {final_url}")
+            if base_url is None:
+                base_url = StorageService.get_base_url(request)
+            
+            final_url = base_url + normalized_path
+            logger.debug("Generated file URL: %s", final_url)
             return final_url
             
         except Exception as e:
@@ -192,6 +304,43 @@ class StorageService:
         """
         return s3_service.delete_file(file_path)
     
+    @staticmethod
+    def delete_files(file_paths: List[str]) -> int:
+        """
+        Delete several files from S3 (batched) or local storage
+        
+        Args:
+            file_paths: S3 URLs or local paths
+            
+        Returns:
+            int: Number of files deleted
+        """
+        if not file_paths:
+            return 0
+        return s3_service.delete_files(file_paths)
+    
+    @staticmethod
+    async def delete_files_async(file_paths: List[str]) -> int:
+        """
+        delete_files for async callers - local unlinks run concurrently on
+        the thread pool, S3 keeps its batched DeleteObjects call
+        
+        Args:
+            file_paths: S3 URLs or local paths
+            
+        Returns:
+            int: Number of files deleted
+        """
+        if not file_paths:
+            return 0
+        if settings.USE_S3:
+            return await asyncio.to_thread(s3_service.delete_files, file_paths)
+        
+        results = await asyncio.gather(
+            *(asyncio.to_thread(s3_service.delete_file, path) for path in dict.fromkeys(file_paths))
+        )
+        return sum(results)
+    
     @staticmethod
     def validate_image_file(file: UploadFile) -> bool:
         """
@@ -295,24 +444,35 @@ class StorageService:
         try:
             import time
             
-            dir_path = Path(directory)
-            if not dir_path.exists():
-                return 0
-            
             deleted_count = 0
             current_time = time.time()
             max_age_seconds = max_age_days * 24 * 60 * 60
             
-            for file_path in dir_path.glob('*'):
-                if file_path.is_file():
-                    file_age = current_time - file_path.stat().st_mtime
-                    if file_age > max_age_seconds:
-                        try:
-                            file_path.unlink()
-                            deleted_count += 1
-                            logger.info(f"Deleted old file: {file_path}")
-                        except Exception as e:
-                            logger.error(f"Failed to delete {file_path}: {str(e)}")
+            # One read per directory (the root plus its shard subdirectories);
+            # scandir entries carry the file type, so only the mtime needs a
+            # stat per file
+            pending = [directory]
+            while pending:
+                try:
+                    entries = os.scandir(pending.pop())
+                except FileNotFoundError:
+                    continue
+                
+                with entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                        file_age = current_time - entry.stat().st_mtime
+                        if file_age > max_age_seconds:
+                            try:
+                                os.unlink(entry.path)
+                                deleted_count += 1
+                                logger.info(f"Deleted old file: {entry.path}")
+                            except Exception as e:
+                                logger.error(f"Failed to delete {entry.path}: {str(e)}")
             
             logger.info(f"Cleanup completed: {deleted_count} files deleted from {directory}")
             return deleted_count
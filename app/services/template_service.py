@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import logging
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models.template import Template
+from app.schemas.template import TemplateListResponse, template_list_adapter
+from app.services.cache_service import cache_service, template_cache_key
+
+logger = logging.getLogger(__name__)
+
+class TemplateService:
+    """
+    Cached reads of the template fields that hot endpoints check
+    (generation access, template access checks) and of the public
+    template listing
+    """
+
+    # Cached template fields (seconds); admin template mutations invalidate
+    # the entry, the TTL bounds staleness otherwise
+    CACHE_TTL = 300
+
+    # Bumped by every admin template mutation; cached public listings are
+    # keyed on it, so one bump retires the copies for every host at once
+    LIST_VERSION_KEY = cache_service.make_key("templates", "version")
+
+    @staticmethod
+    def load_fields(db: Session, template_id: int) -> Optional[dict]:
+        """The template columns access checks read, as a cacheable dict"""
+        template = db.execute(
+            select(
+                Template.id,
+                Template.name,
+                Template.is_free,
+                Template.price
+            ).where(Template.id == template_id)
+        ).first()
+        if not template:
+            return None
+        return {
+            "id": template.id,
+            "name": template.name,
+            "is_free": template.is_free,
+            # Nullable column (an admin update can clear it): treat as the 0.00 default
+            "price": float(template.price) if template.price is not None else 0.0
+        }
+
+    @staticmethod
+    async def get_fields_cached(db: Session, template_id: int) -> dict:
+        """
+        Template fields served from Redis when possible
+
+        Raises:
+            HTTPException: 404 if the template does not exist
+        """
+        cache_key = template_cache_key(template_id)
+        template = await cache_service.get_json(cache_key)
+        if template is None:
+            template = await asyncio.to_thread(TemplateService.load_fields, db, template_id)
+            if template is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Template not found"
+                )
+            await cache_service.set_json(cache_key, template, ttl=TemplateService.CACHE_TTL)
+        return template
+
+    @staticmethod
+    def build_public_list(db: Session, base_url: str) -> str:
+        """All active templates, serialized as a TemplateListResponse JSON body"""
+        templates = db.query(Template).filter(
+            Template.is_active == True
+        ).order_by(Template.display_order).all()
+
+        items = template_list_adapter.validate_python(
+            templates, from_attributes=True, context={"base_url": base_url}
+        )
+        for item in items:
+            item.is_paid = not item.is_free
+        return TemplateListResponse(templates=items, total=len(items)).model_dump_json()
+
+    @staticmethod
+    async def get_public_list_cached(db: Session, base_url: str) -> Tuple[str, str]:
+        """
+        Public template listing as (JSON body, ETag), served from Redis when
+        possible; preview URLs depend on the host, so it is part of the key
+        """
+        version = await cache_service.get_json(TemplateService.LIST_VERSION_KEY) or 0
+        cache_key = cache_service.make_key("templates", "public", f"v{version}", base_url)
+        cached = await cache_service.get_json(cache_key)
+        if cached is not None:
+            return cached["body"], cached["etag"]
+
+        body = await asyncio.to_thread(TemplateService.build_public_list, db, base_url)
+        etag = f'"{hashlib.blake2b(body.encode(), digest_size=16).hexdigest()}"'
+        await cache_service.set_json(
+            cache_key, {"body": body, "etag": etag}, ttl=TemplateService.CACHE_TTL
+        )
+        return body, etag
+
+    @staticmethod
+    async def invalidate_lists() -> None:
+        """Retire every cached public listing (call after a template change commits)"""
+        await cache_service.incr(TemplateService.LIST_VERSION_KEY)
@@ -0,0 +1,8 @@
+from fastapi import Request
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the client's If-None-Match header against the current ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return etag in (tag.strip() for tag in if_none_match.split(","))
@@ -11,4 +11,47 @@ Run this migration to add archive fields to templates table
 ALTER TABLE templates ADD COLUMN is_archived BOOLEAN DEFAULT FALSE;
 ALTER TABLE templates ADD COLUMN archived_at TIMESTAMP NULL;
 UPDATE templates SET is_archived = FALSE WHERE is_archived IS NULL;
-"""
\ No newline at end of file
+"""
+
+# Composite index for the generation history listing:
+"""
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_generations_user_created
+    ON generations (user_id, created_at DESC);
+"""
+
+# Composite indexes for the template listings and payment token lookups:
+"""
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_templates_archived_order
+    ON templates (is_archived, is_active, display_order);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_templates_archived_at
+    ON templates (is_archived, archived_at DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_payment_tokens_user_status
+    ON payment_tokens (user_id, status, payment_status);
+"""
+
+# Foreign-key index used when templates are permanently deleted:
+"""
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_generations_template_id
+    ON generations (template_id);
+"""
+
+# Token reservation state for in-flight generations (enum stores member names):
+"""
+ALTER TYPE tokenstatus ADD VALUE IF NOT EXISTS 'RESERVED';
+"""
+
+# generations.created_at is now filled in by the database, in UTC (naive column):
+"""
+ALTER TABLE generations ALTER COLUMN created_at SET DEFAULT timezone('utc', now());
+"""
+
+# generations.id no longer carries a separate index next to its primary key:
+"""
+DROP INDEX CONCURRENTLY IF EXISTS ix_generations_id;
+"""
+
+# Partial index for the user-facing template listings (active only, by display_order):
+"""
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_templates_active_order
+    ON templates (display_order) WHERE is_active = true;
+"""
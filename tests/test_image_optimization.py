@@ -0,0 +1,87 @@
+"""
+Tests for ImageGenerationService._optimize_image input handling
+Run from the backend directory: python -m pytest tests/test_image_optimization.py
+
+Palette, bilevel and 16-bit inputs must come out as a 9:16 RGB JPEG -
+Image.reduce() does not accept those modes, so they are normalized first.
+"""
+
+import io
+import os
+import sys
+
+# Placeholder settings so app.config loads without a .env (values unused here)
+for key, value in {
+    "DATABASE_URL": "sqlite://",
+    "SECRET_KEY": "test",
+    "GOOGLE_CLIENT_ID": "test",
+    "GOOGLE_CLIENT_SECRET": "test",
+    "GEMINI_API_KEY": "test",
+    "RAZORPAY_KEY_ID": "test",
+    "RAZORPAY_KEY_SECRET": "test",
+    "FRONTEND_URL": "http://localhost:3000",
+    "BACKEND_URL": "http://localhost:8000",
+    "USE_S3": "false",
+}.items():
+    os.environ.setdefault(key, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from PIL import Image
+from app.services.image_generation_service import ImageGenerationService
+
+
+@pytest.fixture(scope="module")
+def service():
+    return ImageGenerationService()
+
+
+def _gradient(size):
+    """Photo-like RGB test image (a smooth gradient, not a flat fill)"""
+    img = Image.linear_gradient("L").resize(size)
+    return Image.merge("RGB", (img, img.rotate(90).resize(size), Image.new("L", size, 128)))
+
+
+def _assert_optimized_jpeg(part):
+    assert part.inline_data.mime_type == "image/jpeg"
+    out = Image.open(io.BytesIO(part.inline_data.data))
+    assert out.format == "JPEG"
+    assert out.mode == "RGB"
+    assert out.size == (576, 1024)
+
+
+@pytest.mark.parametrize("name, mode, save_kwargs", [
+    # Quantized PNG large enough to take the reduce() path
+    ("palette.png", "P", {}),
+    # Palette with a transparent index
+    ("palette_transparent.png", "P", {"transparency": 0}),
+    # Bilevel image
+    ("bilevel.png", "1", {}),
+    # 16-bit greyscale
+    ("grey16.png", "I;16", {}),
+])
+def test_optimize_image_normalizes_unsupported_modes(service, tmp_path, name, mode, save_kwargs):
+    img = _gradient((1600, 2400))
+    if mode == "P":
+        img = img.quantize(colors=64)
+    elif mode == "I;16":
+        img = img.convert("L").convert("I;16")
+    else:
+        img = img.convert(mode)
+    path = tmp_path / name
+    img.save(path, **save_kwargs)
+    assert Image.open(path).mode == mode
+
+    _assert_optimized_jpeg(service._optimize_image(str(path)))
+
+
+def test_optimize_image_small_palette_image(service, tmp_path):
+    # Below the target size: crop only, no reduce/resize
+    path = tmp_path / "small_palette.png"
+    _gradient((400, 400)).quantize(colors=16).save(path)
+
+    part = service._optimize_image(str(path))
+    out = Image.open(io.BytesIO(part.inline_data.data))
+    assert out.mode == "RGB"
+    assert abs(out.width / out.height - 9 / 16) < 0.01